@@ -7,8 +7,8 @@ from fastapi.staticfiles import StaticFiles
 from app.events import register_events
 from app.utils import create_temp_dirs, logger
 from app.static import static_app
-from a2wsgi import WSGIMiddleware
 from app.config import loaded_config
+from app.cache import caches
 import time
 
 create_temp_dirs()
@@ -34,7 +34,7 @@ app = FastAPI(
 app.include_router(v1_router, prefix="/api", tags=["v1"])
 
 if not loaded_config.static_server_url:
-    app.mount("/static", WSGIMiddleware(static_app, workers=50))
+    app.mount("/static", static_app)
 
 
 @app.get("/api/live-check", include_in_schema=False)
@@ -43,6 +43,12 @@ def test_live():
     return {}
 
 
+@app.get("/api/cache-stats", include_in_schema=False)
+def cache_stats():
+    """Usage counters of the in-process caches"""
+    return {name: cache.stats for name, cache in caches.items()}
+
+
 if loaded_config.frontend_dir and not loaded_config.serve_frontend_from_static_server:
     # Lets's serve the frontend from /
     logger.info(f"Serving frontend. Frontend dir: {loaded_config.frontend_dir}")
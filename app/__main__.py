@@ -11,12 +11,15 @@ app = typer.Typer(
 def delete_expired_extracts(
     quiet: t.Annotated[bool, typer.Option(help="Do not stdout anything")] = False
 ):
-    """Delete cached extracted-infos that have expired"""
-    from app.events import event_all_delete_expired_extracted_info
+    """Delete cached extracted-infos and search results that have expired"""
+    from app.sweeper import sweeper
 
-    time_offset = event_all_delete_expired_extracted_info()
+    report = sweeper.sweep()
     if not quiet:
-        print(f"[INFO] Extracts successfully deleted [ Time Offset :  {time_offset} ]")
+        print(
+            f"[INFO] Extracts successfully deleted [ Rows : {report['deleted']} "
+            f"Duration : {report['duration']:.2f}s ]"
+        )
 
 
 fastapi_app.add_typer(app, name="utils")
@@ -0,0 +1,193 @@
+"""In-process caches and request coalescing"""
+
+import asyncio
+import time
+import typing as t
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+
+caches: dict[str, "TTLCache"] = {}
+"""Registered caches mapped to their names"""
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        """`TTLCache` Constructor
+
+        Args:
+            name (str): Cache name. Used when reporting stats.
+            maxsize (int): Maximum entries to hold. 0 disables the cache.
+            ttl (float): Default time-to-live of an entry in seconds.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict[t.Hashable, tuple[float, t.Any]] = OrderedDict()
+        self._lock = Lock()
+        caches[name] = self
+
+    def get(self, key: t.Hashable, default: t.Any = None) -> t.Any:
+        """Get value of a key that has not expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: t.Hashable, value: t.Any, ttl: float = None) -> t.NoReturn:
+        """Cache a value, evicting the least recently used entries when full
+
+        Args:
+            key (t.Hashable): Cache key.
+            value (t.Any): Value to be cached.
+            ttl (float, optional): Entry's time-to-live in seconds. Defaults to `self.ttl`.
+        """
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: t.Hashable) -> t.Any:
+        """Remove a key from cache"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry else None
+
+    def clear(self) -> t.NoReturn:
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self) -> dict[str, int | float]:
+        """Cache usage counters"""
+        with self._lock:
+            return dict(
+                size=len(self._entries),
+                maxsize=self.maxsize,
+                ttl=self.ttl,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                expirations=self.expirations,
+            )
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key into a single execution.
+
+    The first caller of a key runs the function while the rest block
+    and receive its result (or exception).
+    """
+
+    def __init__(self, context_factory: t.Callable[[], t.Any] = None):
+        """`SingleFlight` Constructor
+
+        Args:
+            context_factory (t.Callable, optional): Creates an object shared by the
+                callers of an in-flight key e.g for relaying progress. Defaults to None.
+        """
+        self.context_factory = context_factory
+        self._calls: dict[t.Hashable, tuple[Future, t.Any]] = {}
+        self._lock = Lock()
+
+    def do(self, key: t.Hashable, func: t.Callable, *args, **kwargs) -> t.Any:
+        """Run `func(*args, **kwargs)` unless a call for `key` is in-flight,
+        in which case wait for it and share its outcome."""
+        future, _, is_leader = self.join(key)
+        if not is_leader:
+            return future.result()
+        return self.run(key, future, func, *args, **kwargs)
+
+    def join(self, key: t.Hashable) -> tuple[Future, t.Any, bool]:
+        """Get the in-flight call of a key, registering a new one if there is none.
+
+        Returns:
+            tuple[Future, t.Any, bool]: Call's future, its shared context and whether
+                the caller is responsible for running it through `run`.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call:
+                return *call, False
+            call = (Future(), self.context_factory() if self.context_factory else None)
+            self._calls[key] = call
+            return *call, True
+
+    def run(
+        self, key: t.Hashable, future: Future, func: t.Callable, *args, **kwargs
+    ) -> t.Any:
+        """Execute a joined call and settle its future"""
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    @property
+    def in_flight(self) -> int:
+        """Total keys being executed"""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """Coalesces concurrent coroutine calls sharing a key into a single task.
+
+    The first caller of a key starts the task while the rest await it and
+    receive its result (or exception). A caller being cancelled does not
+    cancel the shared task.
+    """
+
+    def __init__(self):
+        self._calls: dict[t.Hashable, asyncio.Task] = {}
+
+    async def do(
+        self,
+        key: t.Hashable,
+        func: t.Callable[..., t.Awaitable],
+        *args,
+        **kwargs,
+    ) -> t.Any:
+        """Await `func(*args, **kwargs)` unless a call for `key` is in-flight,
+        in which case await it instead."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    @property
+    def in_flight(self) -> int:
+        """Total keys being executed"""
+        return len(self._calls)
@@ -1,15 +1,159 @@
-from sqlmodel import SQLModel, Field, Text, Column, create_engine, Session
-from datetime import datetime
+from sqlmodel import SQLModel, Field, Text, Column, create_engine, Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import LargeBinary, inspect, text, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from app.utils import utc_now
 from app.config import loaded_config
 from datetime import timedelta
+import typing as t
 from yt_dlp_bonus.models import ExtractedInfo
-from json import loads
+from json import loads, dumps
+import zlib
+import re
 
-engine = create_engine(url=loaded_config.database_engine)
+
+def get_engine_kwargs(url: str) -> dict[str, t.Any]:
+    """Pooling options for a database url"""
+    database_url = make_url(url)
+    if database_url.get_backend_name() == "sqlite":
+        if database_url.database in (None, "", ":memory:"):
+            # Each connection gets a database of its own, so all threads
+            # share a single one
+            return dict(
+                connect_args=dict(check_same_thread=False), poolclass=StaticPool
+            )
+        kwargs = dict(connect_args=dict(check_same_thread=False))
+    else:
+        # Server connections can be dropped while idle
+        kwargs = dict(pool_pre_ping=True, pool_recycle=1800)
+    return dict(
+        pool_size=loaded_config.database_pool_size,
+        max_overflow=loaded_config.database_max_overflow,
+        pool_timeout=loaded_config.database_pool_timeout_in_secs,
+        **kwargs,
+    )
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> t.NoReturn:
+    """Let readers proceed alongside a writer and writers queue for the lock
+    instead of failing"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(
+        f"PRAGMA busy_timeout={int(loaded_config.database_busy_timeout_in_secs * 1000)}"
+    )
+    cursor.close()
+
+
+def create_database_engine(url: str) -> Engine:
+    database_engine = create_engine(url=url, **get_engine_kwargs(url))
+    if database_engine.dialect.name == "sqlite":
+        event.listen(database_engine, "connect", set_sqlite_pragmas)
+    return database_engine
+
+
+def create_async_database_engine(url: str) -> AsyncEngine:
+    database_engine = create_async_engine(url=url, **get_engine_kwargs(url))
+    if database_engine.dialect.name == "sqlite":
+        event.listen(database_engine.sync_engine, "connect", set_sqlite_pragmas)
+    return database_engine
+
+
+engine = create_database_engine(loaded_config.database_engine)
+
+async_engine: AsyncEngine | None = (
+    create_async_database_engine(loaded_config.database_async_engine)
+    if loaded_config.database_async_engine
+    else None
+)
+"""Engine of async routes. Their queries run in threads when it's None."""
 
 video_info_cache_period = timedelta(hours=loaded_config.video_info_cache_period_in_hrs)
 
+stream_url_expiry_margin = timedelta(
+    seconds=loaded_config.stream_url_expiry_margin_in_secs
+)
+
+video_info_stale_grace_period = timedelta(
+    seconds=loaded_config.video_info_stale_grace_period_in_secs
+)
+
+search_results_cache_period = timedelta(
+    seconds=loaded_config.search_cache_period_in_secs
+)
+
+
+stream_url_expire_pattern = re.compile(r"[?&/]expire[=/](\d+)")
+"""Expiry timestamp of googlevideo urls, a query parameter of direct urls and
+a path segment of manifest urls"""
+
+
+def get_streams_expire_on(extracted_info: ExtractedInfo) -> datetime | None:
+    """Earliest expiry of extracted_info's stream urls if they expire"""
+    expiry_timestamps = [
+        int(match.group(1))
+        for format in extracted_info.formats
+        if format.url and (match := stream_url_expire_pattern.search(format.url))
+    ]
+    if not expiry_timestamps:
+        return None
+    return datetime.fromtimestamp(min(expiry_timestamps), timezone.utc).replace(
+        tzinfo=None
+    )
+
+
+def is_streams_expiry_usable(streams_expire_on: datetime | None) -> bool:
+    """Checks if stream urls expiring at `streams_expire_on` leave enough time
+    for a download"""
+    return streams_expire_on is None or (
+        streams_expire_on - stream_url_expiry_margin > utc_now()
+    )
+
+
+def has_usable_streams(extracted_info: ExtractedInfo) -> bool:
+    """Checks if extracted_info's stream urls can still be downloaded from"""
+    return is_streams_expiry_usable(get_streams_expire_on(extracted_info))
+
+
+compact_extracted_info_exclude = {
+    "thumbnails",
+    "automatic_captions",
+    "heatmap",
+    "description",
+    "requested_formats",
+    "requested_subtitles",
+}
+"""ExtractedInfo fields not used by the app. Required ones are restored empty."""
+
+
+def compact_extracted_info(extracted_info: ExtractedInfo) -> bytes:
+    """Serialize the parts of extracted_info used by the app, compressed"""
+    info = extracted_info.model_dump(
+        mode="json", exclude_none=True, exclude=compact_extracted_info_exclude
+    )
+    # Storyboards are mhtml formats listing hundreds of fragments
+    info["formats"] = [
+        format for format in info["formats"] if format.get("ext") != "mhtml"
+    ]
+    if not loaded_config.embed_subtitles:
+        info["subtitles"] = {}
+    return zlib.compress(dumps(info, separators=(",", ":")).encode())
+
+
+def expand_extracted_info(data: bytes) -> ExtractedInfo:
+    """Load extracted_info serialized by `compact_extracted_info`"""
+    return ExtractedInfo(
+        thumbnails=[],
+        automatic_captions={},
+        description="",
+        **loads(zlib.decompress(data)),
+    )
+
 
 class VideoInfo(SQLModel, table=True):
     id: str | None = Field(
@@ -17,10 +161,25 @@ class VideoInfo(SQLModel, table=True):
     )
     info: str = Field(
         sa_column=Column(Text, default=None, nullable=False),
-        description="Video info_dict",
+        description="Video info_dict as JSON. Empty once compacted into data.",
+    )
+    data: bytes | None = Field(
+        sa_column=Column(LargeBinary, default=None, nullable=True),
+        description="Compressed compact video info_dict",
+    )
+    summary: bytes | None = Field(
+        sa_column=Column(LargeBinary, default=None, nullable=True),
+        description="Serialized video metadata response",
+    )
+    summary_format: str | None = Field(
+        default=None,
+        description="Default video and audio extensions the summary was made for",
+    )
+    streams_expire_on: datetime | None = Field(
+        default=None, description="Earliest expiry of the info's stream urls"
     )
     updated_on: datetime = Field(
-        default_factory=utc_now, description="Last time to be updated"
+        default_factory=utc_now, index=True, description="Last time to be updated"
     )
 
     @property
@@ -28,17 +187,156 @@ class VideoInfo(SQLModel, table=True):
         """Checks if the current info is still relevant"""
         return (utc_now() - self.updated_on) <= video_info_cache_period
 
+    @property
+    def remaining_validity(self) -> float:
+        """Seconds left before the current info expires"""
+        return (self.updated_on + video_info_cache_period - utc_now()).total_seconds()
+
+    @property
+    def is_within_grace(self) -> bool:
+        """Checks if the info has expired but can still be served while it's
+        being refreshed"""
+        return not self.is_valid and self.remaining_grace > 0
+
+    @property
+    def remaining_grace(self) -> float:
+        """Seconds left before the info can no longer be served stale"""
+        return self.remaining_validity + video_info_stale_grace_period.total_seconds()
+
     @property
     def extracted_info(self) -> ExtractedInfo:
+        if self.data is not None:
+            return expand_extracted_info(self.data)
         return ExtractedInfo(**loads(self.info))
 
+    @property
+    def has_usable_streams(self) -> bool:
+        """Checks if the info's stream urls can still be downloaded from"""
+        return is_streams_expiry_usable(self.streams_expire_on)
+
+    def set_extracted_info(self, extracted_info: ExtractedInfo) -> t.NoReturn:
+        """Store extracted_info in compact form"""
+        self.data = compact_extracted_info(extracted_info)
+        self.info = ""
+        self.streams_expire_on = get_streams_expire_on(extracted_info)
+
+
+class SearchResult(SQLModel, table=True):
+    query: str = Field(
+        primary_key=True,
+        description="Normalized search query, followed by the continuation "
+        "token the results start at if any",
+    )
+    results: str = Field(
+        sa_column=Column(Text, default=None, nullable=False),
+        description="Metadata of the videos found as JSON",
+    )
+    continuation: str | None = Field(
+        sa_column=Column(Text, default=None, nullable=True),
+        description="Continuation token of the results that follow",
+    )
+    updated_on: datetime = Field(
+        default_factory=utc_now, index=True, description="Last time to be updated"
+    )
+
+    @property
+    def is_valid(self) -> bool:
+        """Checks if the results are still relevant"""
+        return (utc_now() - self.updated_on) <= search_results_cache_period
+
+    @property
+    def remaining_validity(self) -> float:
+        """Seconds left before the results expire"""
+        return (
+            self.updated_on + search_results_cache_period - utc_now()
+        ).total_seconds()
+
+    @property
+    def videos(self) -> list[dict[str, str]]:
+        return loads(self.results)
+
+
+class DownloadArtifact(SQLModel, table=True):
+    key: str = Field(
+        primary_key=True, description="Normalized download request identifier"
+    )
+    video_id: str = Field(index=True, description="Youtube video id")
+    filename: str = Field(
+        index=True, description="Name of the file in download directory"
+    )
+    filesize: int = Field(description="File size in bytes")
+    created_on: datetime = Field(
+        default_factory=utc_now, description="Time the file was produced"
+    )
+    last_accessed_on: datetime | None = Field(
+        default=None, description="Last time the file was served"
+    )
+    access_count: int | None = Field(
+        default=0, description="Number of times the file has been served"
+    )
+
 
 def create_tables():
     """Create database tables"""
     SQLModel.metadata.create_all(bind=engine)
+    add_missing_columns()
+
+
+def add_missing_columns():
+    """Add columns introduced after a table was created.
+    Only nullable columns can be added this way."""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            existing_columns = {
+                column["name"] for column in inspector.get_columns(table.name)
+            }
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(
+                    text(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                    )
+                )
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+
+
+def compact_video_infos(batch_size: int = 100) -> int:
+    """Convert VideoInfo rows stored as JSON text to the compact form.
+
+    Returns:
+        int: Rows converted.
+    """
+    converted = 0
+    query = select(VideoInfo).where(VideoInfo.data.is_(None)).limit(batch_size)
+    while True:
+        with Session(bind=engine) as session:
+            video_infos = session.exec(query).all()
+            for video_info in video_infos:
+                try:
+                    video_info.set_extracted_info(video_info.extracted_info)
+                except (ValueError, TypeError):
+                    # Unreadable info, it's only a cache entry
+                    session.delete(video_info)
+                    continue
+                session.add(video_info)
+            session.commit()
+        converted += len(video_infos)
+        if len(video_infos) < batch_size:
+            return converted
 
 
 def get_session():
     """Database session"""
     with Session(engine) as session:
         yield session
+
+
+@asynccontextmanager
+async def get_async_session() -> t.AsyncIterator[AsyncSession]:
+    """Database session bound to `async_engine`"""
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
@@ -1,12 +1,20 @@
 """Startup and shutdown events"""
 
-from app.utils import create_temp_dirs, download_dir, utc_now, logger
+from app.utils import create_temp_dirs, download_dir, logger
 from fastapi import FastAPI
 from shutil import rmtree
-from app.db import create_tables, VideoInfo, engine
-from sqlmodel import Session, delete
+from app.db import create_tables, compact_video_infos
 from app.config import loaded_config
-from datetime import timedelta
+from threading import Thread
+
+
+def event_startup_start_download_processes():
+    # Handlers run in the order defined. Workers are forked ahead of the ones
+    # starting threads.
+    if loaded_config.download_executor == "process":
+        from app.v1.downloads import process_downloader
+
+        process_downloader.start()
 
 
 def event_startup_create_tempdirs():
@@ -17,19 +25,81 @@ def event_startup_create_tables():
     create_tables()
 
 
-def event_all_delete_expired_extracted_info():
-    time_offset = utc_now() - timedelta(
-        hours=loaded_config.video_info_cache_period_in_hrs
-    )
-    delete_query = delete(VideoInfo).where(VideoInfo.updated_on < time_offset)
-    with Session(bind=engine) as session:
-        logger.info(f"Deleting expired extracted-infos [< {time_offset}]")
-        session.exec(delete_query)
-        session.commit()
-        return time_offset
+def event_startup_compact_video_infos():
+    def compact():
+        try:
+            converted = compact_video_infos()
+        except Exception as e:
+            logger.exception(e)
+            return
+        if converted:
+            logger.info(f"Compacted {converted} cached extracted-infos")
+
+    Thread(target=compact, name="compact-video-infos", daemon=True).start()
+
+
+def event_startup_start_expiry_sweeper():
+    from app.sweeper import sweeper
+
+    sweeper.start()
+
+
+def event_shutdown_stop_expiry_sweeper():
+    from app.sweeper import sweeper
+
+    sweeper.stop()
+
+
+def event_startup_start_hot_video_info_refresher():
+    from app.v1.refresh import hot_video_info_refresher
+    from app.v1.downloads import yt
+
+    hot_video_info_refresher.start(yt)
+
+
+def event_shutdown_stop_video_info_refreshes():
+    from app.v1.refresh import hot_video_info_refresher
+    from app.v1.utils import video_info_refresh_executor
+
+    hot_video_info_refresher.stop()
+    video_info_refresh_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def event_shutdown_stop_download_workers():
+    from app.v1.routes import download_jobs
+    from app.v1.downloads import process_downloader
+
+    download_jobs.stop()
+    process_downloader.shutdown()
+
+
+def event_startup_start_storage_manager():
+    from app.storage import storage
+
+    storage.start()
+
+
+def event_shutdown_stop_metadata_workers():
+    from app.v1.routes import metadata_executor
+
+    metadata_executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def event_shutdown_close_http_clients():
+    from app.v1.search import innertube_client
+    from app.v1.streaming import media_client
+
+    await innertube_client.aclose()
+    await media_client.aclose()
 
 
 def event_shutdown_clear_previous_downloads():
+    from app.storage import storage
+
+    if storage.is_enabled:
+        # Downloads are kept within budget and reused across restarts
+        storage.stop()
+        return
     rmtree(download_dir)
 
 
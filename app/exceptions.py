@@ -3,3 +3,19 @@
 
 class InvalidVideoUrl(Exception):
     """Raised when invalid youtube video url is encountered"""
+
+
+class InvalidPlaylistUrl(Exception):
+    """Raised when invalid youtube playlist or channel url is encountered"""
+
+
+class DownloadQueueFull(Exception):
+    """Raised when download jobs queue cannot take more jobs"""
+
+
+class DownloadQueueStopped(Exception):
+    """Raised when download jobs are submitted to or left in a stopped queue"""
+
+
+class InvalidSearchCursor(Exception):
+    """Raised when a search cursor cannot be decoded"""
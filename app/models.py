@@ -15,7 +15,9 @@ import logging
 
 
 class CustomWebsocketResponse(BaseModel):
-    status: Literal["downloading", "finished", "completed", "error"]
+    status: Literal[
+        "queued", "running", "downloading", "finished", "completed", "error"
+    ]
     detail: dict
 
 
@@ -42,11 +44,142 @@ class EnvVariables(BaseModel):
     working_directory: Optional[str] = os.getcwd()
     clear_temps: Optional[bool] = True
     search_limit: Optional[int] = 50
+    search_cache_period_in_secs: Optional[PositiveInt] = Field(
+        3600, description="Time for search results to be served from cache."
+    )
+    search_memory_cache_size: Optional[int] = Field(
+        256, description="Search results to hold in memory. 0 disables it."
+    )
+    search_connect_timeout_in_secs: Optional[float] = Field(
+        5, description="Time to wait for a connection to youtube when searching."
+    )
+    search_read_timeout_in_secs: Optional[float] = Field(
+        10, description="Time to wait for youtube to respond to a search."
+    )
+    search_max_connections: Optional[PositiveInt] = Field(
+        100, description="Connections to youtube to keep open for searching."
+    )
+    metadata_batch_limit: Optional[PositiveInt] = Field(
+        50, description="Videos a metadata batch request can ask for."
+    )
+    metadata_batch_workers: Optional[PositiveInt] = Field(
+        8, description="Video infos to extract concurrently for metadata batches."
+    )
+    playlist_entries_limit: Optional[PositiveInt] = Field(
+        200, description="Videos of a playlist or channel to list at most."
+    )
+    playlist_cache_ttl_in_secs: Optional[int] = Field(
+        600, description="Time for listed playlist or channel videos to live in memory."
+    )
+    playlist_download_workers: Optional[PositiveInt] = Field(
+        3,
+        description="Videos of a playlist download to fetch concurrently. "
+        "Each still waits for one of the download_workers slots.",
+    )
+    download_workers: Optional[PositiveInt] = Field(
+        4, description="Downloads to process concurrently."
+    )
+    download_executor: Literal["thread", "process"] = Field(
+        "thread",
+        description="Run downloads in worker threads or in worker processes.",
+    )
+    download_queue_size: Optional[int] = Field(
+        100, description="Downloads allowed to wait for a worker."
+    )
+    download_queue_size_per_client: Optional[int] = Field(
+        5, description="Downloads a single client is allowed to have waiting."
+    )
+    trust_forwarded_for: Optional[bool] = Field(
+        False,
+        description="Identify clients by X-Forwarded-For header. "
+        "Enable only behind a trusted proxy setting it.",
+    )
+    download_job_retention_in_secs: Optional[int] = Field(
+        3600, description="Time to keep finished download jobs for status queries."
+    )
     video_info_cache_period_in_hrs: Optional[PositiveInt] = 4
+    stream_url_expiry_margin_in_secs: Optional[int] = Field(
+        900,
+        description="Time left before stream urls expire below which cached video "
+        "infos are re-extracted for downloads.",
+    )
+    video_info_stale_grace_period_in_secs: Optional[int] = Field(
+        3600,
+        description="Time an expired video info is still served while it's refreshed "
+        "in the background. 0 disables it.",
+    )
+    video_info_refresh_ahead_in_secs: Optional[int] = Field(
+        600,
+        description="Time before expiry to refresh video infos of popular videos. "
+        "0 disables it.",
+    )
+    video_info_hot_access_count: Optional[PositiveInt] = Field(
+        5,
+        description="Accesses within half of video_info_refresh_ahead_in_secs "
+        "that make a video popular.",
+    )
+    video_info_refresh_workers: Optional[PositiveInt] = Field(
+        2, description="Threads refreshing video infos in the background."
+    )
+    expiry_sweep_interval_in_secs: Optional[PositiveInt] = Field(
+        600, description="Time between background deletions of expired cache entries."
+    )
+    expiry_sweep_batch_size: Optional[PositiveInt] = Field(
+        1000, description="Expired cache entries to delete per transaction."
+    )
+    video_info_memory_cache_size: Optional[int] = Field(
+        512, description="Extracted-infos to hold in memory. 0 disables it."
+    )
+    video_info_memory_cache_ttl_in_secs: Optional[int] = Field(
+        900, description="Time for an extracted-info to live in memory."
+    )
     database_engine: Optional[str] = "sqlite:///db.sqlite3"
+    database_async_engine: Optional[str] = Field(
+        None,
+        description="Async driver url of the same database e.g sqlite+aiosqlite:///db.sqlite3. "
+        "Unset runs database queries of async routes in threads.",
+    )
+    database_pool_size: Optional[PositiveInt] = Field(
+        10, description="Database connections to keep open."
+    )
+    database_max_overflow: Optional[int] = Field(
+        20, description="Connections to open beyond pool size under load."
+    )
+    database_pool_timeout_in_secs: Optional[float] = Field(
+        30, description="Time to wait for a free connection."
+    )
+    database_busy_timeout_in_secs: Optional[float] = Field(
+        15, description="Time a SQLite writer waits for the lock to be released."
+    )
     default_extension: Literal["mp4", "webm"] = "webm"
     frontend_dir: Optional[str] = None
 
+    stream_chunk_size: Optional[PositiveInt] = Field(
+        10_485_760, description="Size in bytes of each range fetched when streaming."
+    )
+    websocket_progress_interval_in_secs: Optional[float] = Field(
+        0.5, description="Minimum time between download progress updates."
+    )
+    websocket_progress_min_change: Optional[float] = Field(
+        1.0, description="Minimum progress change (percent) worth an update."
+    )
+    download_dir_max_size: Optional[PositiveInt] = Field(
+        None,
+        description="Byte budget of the download directory. Unset disables eviction.",
+    )
+    download_dir_high_watermark: Optional[float] = Field(
+        0.9, description="Fraction of the byte budget that triggers eviction."
+    )
+    download_dir_low_watermark: Optional[float] = Field(
+        0.75, description="Fraction of the byte budget eviction brings usage down to."
+    )
+    download_dir_eviction_policy: Optional[Literal["lru", "lfu"]] = Field(
+        "lru", description="Order in which downloaded files are evicted."
+    )
+    storage_check_interval_in_secs: Optional[PositiveInt] = Field(
+        300, description="Time between download directory usage checks."
+    )
+
     # static server options
     static_server_url: Optional[str] = None
 
@@ -72,6 +205,21 @@ class EnvVariables(BaseModel):
     noprogress: Optional[bool] = False
     nopart: Optional[bool] = False
     concurrent_fragment_downloads: Optional[int] = 1
+    download_engine: Literal["native", "parallel"] = Field(
+        "native",
+        description="Downloader of http streams. parallel fetches byte ranges of "
+        "a stream over multiple connections.",
+    )
+    download_range_chunk_size: Optional[PositiveInt] = Field(
+        10_485_760, description="Size in bytes of each range fetched in parallel."
+    )
+    download_range_max_connections: Optional[PositiveInt] = Field(
+        8, description="Parallel range requests a download can make at most."
+    )
+    parallel_merged_streams: Optional[bool] = Field(
+        True,
+        description="Fetch the video and audio streams of merged formats concurrently.",
+    )
     # YoutubeDL params
     verbose: Optional[bool] = None
     quiet: Optional[bool] = None
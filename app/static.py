@@ -1,29 +1,151 @@
-"""This module contains code for serving static contents using flask framework"""
+"""This module contains code for serving static contents (audios and videos) natively over ASGI"""
 
-from flask import Flask, request, send_from_directory
+import os
+import stat
+import anyio
+from starlette.applications import Starlette
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import FileResponse, PlainTextResponse, Response
+from starlette.routing import Route
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Receive, Scope, Send
 from app.config import download_dir
+from app.storage import storage
 from urllib.parse import unquote
 from os import getcwd
 from pathlib import Path
-
-app = Flask(__name__)
-static_app = app
+from email.utils import parsedate
 
 ref_directory = (
     download_dir
     if download_dir.is_absolute()
     else Path(getcwd()).joinpath(download_dir)
-)
+).resolve()
+
+zerocopysend_extension = "http.response.zerocopysend"
+
+
+def is_not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+    """Checks whether the client's cached copy of the file is still fresh"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        return response_headers.get("etag") in [
+            tag.strip(" W/") for tag in if_none_match.split(",")
+        ]
+    if_modified_since = parsedate(request_headers.get("if-modified-since", ""))
+    last_modified = parsedate(response_headers.get("last-modified", ""))
+    return bool(
+        if_modified_since and last_modified and if_modified_since >= last_modified
+    )
+
+
+def is_whole_transfer(scope: Scope, request_headers: Headers) -> bool:
+    """Checks whether a request fetches the file from its start, as opposed to
+    seeking within it or revalidating a cached copy"""
+    byte_range = request_headers.get("range", "bytes=0-").replace(" ", "")
+    return scope["method"] == "GET" and byte_range.startswith("bytes=0-")
+
+
+class MediaFileResponse(FileResponse):
+    """File response for media files.
+
+    - Answers `If-None-Match`/`If-Modified-Since` with `304`.
+    - Supports `HEAD` and single or multiple byte `Range` requests.
+    - Hands whole-file transfers to the server's `sendfile` when it supports
+      the ASGI zero-copy send extension, otherwise streams the file in chunks.
+    - Keeps the file from being evicted while it is being sent. Only whole
+      transfers count as accesses of the file, not every seek of a player.
+    """
+
+    chunk_size = 1024 * 1024
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        not_modified = is_not_modified(self.headers, request_headers)
+        with storage.serving(
+            Path(self.path).name,
+            is_access=not not_modified and is_whole_transfer(scope, request_headers),
+        ):
+            if not_modified:
+                return await NotModifiedResponse(self.headers)(scope, receive, send)
+            await self._send_file(scope, receive, send)
 
+    async def _send_file(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        if (
+            zerocopysend_extension in scope.get("extensions", {})
+            and scope["method"] == "GET"
+            and "range" not in request_headers
+        ):
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            file = await anyio.to_thread.run_sync(open, self.path, "rb")
+            try:
+                await send(
+                    {
+                        "type": zerocopysend_extension,
+                        "file": file,
+                        "count": self.stat_result.st_size,
+                    }
+                )
+            finally:
+                file.close()
+            return
 
-@app.get("/file/<path:name>")
-def send_static_file(name):
-    download = request.args.get("download", "0") in ("1", "true")
-    return send_from_directory(ref_directory, unquote(name), as_attachment=download)
+        await super().__call__(scope, receive, send)
+
+
+def get_media_path(name: str) -> Path | None:
+    """Resolve a requested filename to a file within the download directory"""
+    media_path = ref_directory.joinpath(unquote(name)).resolve()
+    if media_path.parent != ref_directory:
+        return
+    return media_path
+
+
+async def serve_static_file(
+    media_path: Path | None, download: bool = False
+) -> Response:
+    """Respond with a media file in the download directory"""
+    try:
+        if media_path is None:
+            raise FileNotFoundError()
+        stat_result = await anyio.to_thread.run_sync(os.stat, media_path)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise FileNotFoundError(media_path)
+    except FileNotFoundError:
+        return PlainTextResponse("File not found", status_code=404)
+
+    return MediaFileResponse(
+        media_path,
+        stat_result=stat_result,
+        filename=media_path.name if download else None,
+        headers={"Cache-Control": "public, max-age=7200"},
+    )
+
+
+async def send_static_file(request: Request) -> Response:
+    download = request.query_params.get("download", "0") in ("1", "true")
+    return await serve_static_file(
+        get_media_path(request.path_params["name"]), download=download
+    )
+
+
+app = Starlette(
+    routes=[Route("/file/{name:path}", send_static_file, methods=["GET", "HEAD"])]
+)
+static_app = app
 
 
 if __name__ == "__main__":
     import argparse
+    import uvicorn
 
     parser = argparse.ArgumentParser(
         prog="y2mate-clone-static-server",
@@ -40,4 +162,4 @@ if __name__ == "__main__":
         "-p", "--port", help="Port to listen at - %(default)d", default=8080
     )
     args = parser.parse_args()
-    app.run(host=args.host, port=args.port, debug=False)
+    uvicorn.run(app, host=args.host, port=int(args.port))
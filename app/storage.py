@@ -0,0 +1,231 @@
+"""Management of disk space taken by downloaded files"""
+
+import os
+import time
+import typing as t
+from contextlib import contextmanager
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from threading import Event, Lock, Thread
+from sqlmodel import Session, select
+from app.config import loaded_config, download_dir
+from app.db import DownloadArtifact, engine
+from app.utils import logger, utc_now
+
+incomplete_file_markers = (".part", ".ytdl", ".temp.")
+"""Name fragments of files still being written by yt-dlp or ffmpeg"""
+
+orphan_grace_period_in_secs = 3600
+"""Age an unindexed file must reach before it can be evicted. Files being
+post-processed have no index entry yet and keep getting modified."""
+
+
+class StorageManager:
+    """Keeps the download directory within a byte budget.
+
+    Once the directory exceeds the high watermark, files are evicted by the
+    configured policy (`lru` - least recently served first, `lfu` - least
+    frequently served first) until it is back under the low watermark.
+    Access statistics are persisted in the `DownloadArtifact` table so that
+    eviction decisions survive restarts. Files being written or served are
+    never evicted.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_size: int | None,
+        high_watermark: float,
+        low_watermark: float,
+        policy: t.Literal["lru", "lfu"],
+        interval_in_secs: int,
+    ):
+        """`StorageManager` Constructor
+
+        Args:
+            directory (Path): Directory containing the downloaded files.
+            max_size (int | None): Byte budget of the directory. None disables eviction.
+            high_watermark (float): Fraction of `max_size` that triggers eviction.
+            low_watermark (float): Fraction of `max_size` eviction brings usage down to.
+            policy (t.Literal["lru", "lfu"]): Eviction order.
+            interval_in_secs (int): Time between periodic checks.
+        """
+        assert (
+            0 < low_watermark <= high_watermark <= 1
+        ), "Storage watermarks must satisfy 0 < low_watermark <= high_watermark <= 1"
+        self.directory = directory
+        self.max_size = max_size
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.policy = policy
+        self.interval_in_secs = interval_in_secs
+        self._accesses: Counter[str] = Counter()
+        self._last_accessed_on: dict[str, datetime] = {}
+        self._serving: Counter[str] = Counter()
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._stopped = Event()
+        self._thread: Thread = None
+
+    @property
+    def is_enabled(self) -> bool:
+        return bool(self.max_size)
+
+    def record_access(self, filename: str) -> t.NoReturn:
+        """Note that a file has been handed to a client"""
+        with self._lock:
+            self._accesses[filename] += 1
+            self._last_accessed_on[filename] = utc_now()
+
+    @contextmanager
+    def serving(self, filename: str, is_access: bool = True):
+        """Protect a file from eviction while it is being sent.
+        `is_access` tells whether to count it as one of the file's accesses."""
+        if is_access:
+            self.record_access(filename)
+        with self._lock:
+            self._serving[filename] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._serving[filename] -= 1
+                if not self._serving[filename]:
+                    del self._serving[filename]
+
+    def request_check(self) -> t.NoReturn:
+        """Wake the manager up to check usage without waiting for the interval"""
+        self._wakeup.set()
+
+    def start(self) -> t.NoReturn:
+        if not self.is_enabled or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name="storage-manager", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> t.NoReturn:
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread = None
+        self.flush_accesses()
+
+    def flush_accesses(self) -> t.NoReturn:
+        """Persist access statistics gathered since the last flush"""
+        with self._lock:
+            accesses, self._accesses = self._accesses, Counter()
+            last_accessed_on, self._last_accessed_on = self._last_accessed_on, {}
+        if not accesses:
+            return
+        with Session(bind=engine) as session:
+            artifacts = session.exec(
+                select(DownloadArtifact).where(
+                    DownloadArtifact.filename.in_(list(accesses))
+                )
+            ).all()
+            for artifact in artifacts:
+                artifact.access_count = (artifact.access_count or 0) + accesses[
+                    artifact.filename
+                ]
+                artifact.last_accessed_on = last_accessed_on[artifact.filename]
+                session.add(artifact)
+            session.commit()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                logger.exception(e)
+            self._wakeup.wait(self.interval_in_secs)
+            self._wakeup.clear()
+
+    def _is_evictable(self, name: str) -> bool:
+        if any(marker in name for marker in incomplete_file_markers):
+            return False
+        with self._lock:
+            return name not in self._serving
+
+    def check(self) -> dict[str, int]:
+        """Evict files if usage exceeds the high watermark
+
+        Returns:
+            dict[str, int]: Directory size before and after, files and bytes evicted.
+        """
+        self.flush_accesses()
+        files: dict[str, tuple[Path, os.stat_result]] = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    files[entry.name] = (Path(entry.path), entry.stat())
+        size = sum(stat_result.st_size for _, stat_result in files.values())
+        report = dict(size=size, evicted_files=0, evicted_bytes=0)
+        if not self.is_enabled or size <= self.max_size * self.high_watermark:
+            return report
+
+        with Session(bind=engine) as session:
+            artifacts = {
+                artifact.filename: artifact
+                for artifact in session.exec(
+                    select(DownloadArtifact).where(
+                        DownloadArtifact.filename.in_(list(files))
+                    )
+                ).all()
+            }
+            candidates = []
+            now = time.time()
+            for name, (path, stat_result) in files.items():
+                if not self._is_evictable(name):
+                    continue
+                artifact = artifacts.get(name)
+                if artifact is None:
+                    if now - stat_result.st_mtime < orphan_grace_period_in_secs:
+                        continue
+                    last_used = stat_result.st_mtime
+                    access_count = 0
+                else:
+                    last_used = (
+                        artifact.last_accessed_on or artifact.created_on
+                    ).timestamp()
+                    access_count = artifact.access_count or 0
+                rank = (
+                    (access_count, last_used)
+                    if self.policy == "lfu"
+                    else (last_used, access_count)
+                )
+                candidates.append((rank, name, path, stat_result.st_size))
+
+            target_size = self.max_size * self.low_watermark
+            for _, name, path, filesize in sorted(candidates):
+                if size <= target_size:
+                    break
+                if not self._is_evictable(name):
+                    continue
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                size -= filesize
+                report["evicted_files"] += 1
+                report["evicted_bytes"] += filesize
+                if name in artifacts:
+                    session.delete(artifacts[name])
+            session.commit()
+
+        report["size"] = size
+        logger.info(
+            f"Evicted {report['evicted_files']} files "
+            f"({report['evicted_bytes']} bytes) from {self.directory}"
+        )
+        return report
+
+
+storage = StorageManager(
+    directory=download_dir,
+    max_size=loaded_config.download_dir_max_size,
+    high_watermark=loaded_config.download_dir_high_watermark,
+    low_watermark=loaded_config.download_dir_low_watermark,
+    policy=loaded_config.download_dir_eviction_policy,
+    interval_in_secs=loaded_config.storage_check_interval_in_secs,
+)
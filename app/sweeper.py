@@ -0,0 +1,125 @@
+"""Background deletion of expired cache entries"""
+
+import time
+import typing as t
+from datetime import timedelta
+from threading import Event, Thread
+from sqlmodel import SQLModel, Session, delete, select
+from app.config import loaded_config
+from app.db import (
+    VideoInfo,
+    SearchResult,
+    engine,
+    video_info_cache_period,
+    video_info_stale_grace_period,
+    search_results_cache_period,
+)
+from app.utils import logger, utc_now
+
+
+class ExpirySweeper:
+    """Deletes expired rows of cache tables in small batches.
+
+    Each batch is a short transaction over the oldest rows, located through
+    the index on `updated_on`, so the database stays writable by requests
+    in between batches regardless of how many rows have expired.
+    """
+
+    def __init__(
+        self,
+        tables: dict[type[SQLModel], timedelta],
+        batch_size: int,
+        interval_in_secs: int,
+    ):
+        """`ExpirySweeper` Constructor
+
+        Args:
+            tables (dict[type[SQLModel], timedelta]): Cache tables having an
+                indexed `updated_on` column and the period their rows stay valid.
+            batch_size (int): Rows to delete per transaction.
+            interval_in_secs (int): Time between periodic sweeps.
+        """
+        self.tables = tables
+        self.batch_size = batch_size
+        self.interval_in_secs = interval_in_secs
+        self._wakeup = Event()
+        self._stopped = Event()
+        self._thread: Thread = None
+
+    def start(self) -> t.NoReturn:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name="expiry-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> t.NoReturn:
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.exception(e)
+            self._wakeup.wait(self.interval_in_secs)
+            self._wakeup.clear()
+
+    def sweep_table(self, table: type[SQLModel], period: timedelta) -> int:
+        """Delete expired rows of a table batch by batch.
+
+        Returns:
+            int: Rows deleted.
+        """
+        time_offset = utc_now() - period
+        primary_key = table.__table__.primary_key.columns[0]
+        expired_keys = (
+            select(primary_key)
+            .where(table.updated_on < time_offset)
+            .order_by(table.updated_on)
+            .limit(self.batch_size)
+        )
+        deleted = 0
+        while not self._stopped.is_set():
+            with Session(bind=engine) as session:
+                result = session.exec(
+                    delete(table).where(primary_key.in_(expired_keys.scalar_subquery()))
+                )
+                session.commit()
+            deleted += result.rowcount
+            if result.rowcount < self.batch_size:
+                break
+        return deleted
+
+    def sweep(self) -> dict[str, t.Any]:
+        """Delete expired rows of all tables.
+
+        Returns:
+            dict[str, t.Any]: Rows deleted per table and duration in seconds.
+        """
+        started_at = time.perf_counter()
+        deleted = {
+            table.__tablename__: self.sweep_table(table, period)
+            for table, period in self.tables.items()
+        }
+        report = dict(deleted=deleted, duration=time.perf_counter() - started_at)
+        if any(deleted.values()):
+            logger.info(
+                "Deleted expired cache entries "
+                + ", ".join(f"{name}: {rows}" for name, rows in deleted.items())
+                + f" in {report['duration']:.2f}s"
+            )
+        return report
+
+
+sweeper = ExpirySweeper(
+    tables={
+        # Expired infos are served while being refreshed within the grace period
+        VideoInfo: video_info_cache_period + video_info_stale_grace_period,
+        SearchResult: search_results_cache_period,
+    },
+    batch_size=loaded_config.expiry_sweep_batch_size,
+    interval_in_secs=loaded_config.expiry_sweep_interval_in_secs,
+)
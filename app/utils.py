@@ -2,6 +2,7 @@
 
 import os
 import re
+import inspect
 import logging
 from pathlib import Path
 import typing as t
@@ -15,7 +16,13 @@ from yt_dlp_bonus.exceptions import (
 )
 from yt_dlp.utils import DownloadError
 from datetime import datetime, timezone
-from app.exceptions import InvalidVideoUrl
+from app.exceptions import (
+    InvalidVideoUrl,
+    InvalidPlaylistUrl,
+    InvalidSearchCursor,
+    DownloadQueueFull,
+    DownloadQueueStopped,
+)
 from app.config import download_dir, loaded_config
 from fastapi import Request, WebSocket
 
@@ -34,6 +41,24 @@ compiled_video_id_patterns = (
     ),  # Short watch link
 )
 
+compiled_playlist_id_patterns = (
+    re.compile(
+        r"^https?://(?:www\.|m\.|music\.)?youtube\.com/(?:playlist|watch)\?(?:.*&)?list=([\w\-_]+).*"
+    ),  # playlist or watch link
+    re.compile(
+        r"^https?://youtu\.be/[\w\-_]{11}\?(?:.*&)?list=([\w\-_]+).*"
+    ),  # shareable link
+    re.compile(r"^((?:PL|OLAK5uy_|UU|FL)[\w\-_]{10,})$"),  # playlist id only
+)
+
+compiled_channel_path_patterns = (
+    re.compile(
+        r"^https?://(?:www\.|m\.)?youtube\.com/(@[\w\-_.]+|channel/UC[\w\-_]{22}|c/[\w\-_.]+|user/[\w\-_.]+)(?:[/?].*)?$"
+    ),  # channel link
+    re.compile(r"^(@[\w\-_.]+)$"),  # channel handle only
+    re.compile(r"^(UC[\w\-_]{22})$"),  # channel id only
+)
+
 compiled_ytdlp_download_error_msg_pattern = re.compile(
     r".*\s[\w\-_]{11}:\s+(Video\s+.+)"
 )
@@ -52,46 +77,74 @@ def sanitize_filename(filename: Path | str) -> str:
     return cleaned.strip()
 
 
+def _to_http_exception(e: Exception) -> HTTPException:
+    """Map route exceptions to their respective HTTPException"""
+    if isinstance(e, HTTPException):
+        return e
+
+    elif isinstance(
+        e,
+        (
+            AssertionError,
+            UserInputError,
+            InvalidVideoUrl,
+            InvalidPlaylistUrl,
+            InvalidSearchCursor,
+            FileSizeOutOfRange,
+            UknownDownloadFailure,
+        ),
+    ):
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    elif isinstance(e, DownloadQueueFull):
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e)
+        )
+    elif isinstance(e, DownloadQueueStopped):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        )
+    elif isinstance(e, DownloadError):
+        msg = re.findall(compiled_ytdlp_download_error_msg_pattern, e.msg)
+        if msg:
+            detail = msg[0]
+            status_code = status.HTTP_403_FORBIDDEN
+        else:
+            detail = "Server encountered an issue while trying to handle that request!"
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+
+        return HTTPException(status_code, detail)
+    else:
+        logger.exception(e)
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        detail = "Server encountered an issue while trying to handle that request!"
+        return HTTPException(status_code=status_code, detail=detail)
+
+
 def router_exception_handler(func: t.Callable):
     """Decorator for handling api routes exceptions accordingly
 
     Args:
-        func (t.Callable): FastAPI router.
+        func (t.Callable): FastAPI router. Can be a coroutine function.
     """
 
+    if inspect.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def async_decorator(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                raise _to_http_exception(e)
+
+        return async_decorator
+
     @wraps(func)
     def decorator(*args, **kwargs):
         try:
             resp = func(*args, **kwargs)
             return resp
-        except HTTPException as e:
-            raise e
-
-        except (
-            AssertionError,
-            UserInputError,
-            InvalidVideoUrl,
-            FileSizeOutOfRange,
-            UknownDownloadFailure,
-        ) as e:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
-        except DownloadError as e:
-            msg = re.findall(compiled_ytdlp_download_error_msg_pattern, e.msg)
-            if msg:
-                detail = msg[0]
-                status_code = status.HTTP_403_FORBIDDEN
-            else:
-                detail = (
-                    "Server encountered an issue while trying to handle that request!"
-                )
-                status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-
-            raise HTTPException(status_code, detail)
         except Exception as e:
-            logger.exception(e)
-            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            detail = "Server encountered an issue while trying to handle that request!"
-            raise HTTPException(status_code=status_code, detail=detail)
+            raise _to_http_exception(e)
 
     return decorator
 
@@ -116,10 +169,51 @@ def get_video_id(url: str) -> str:
     for compiled_pattern in compiled_video_id_patterns:
         match = compiled_pattern.match(url)
         if match:
-            return match.group()
+            return match.group(1)
     raise InvalidVideoUrl(f"Invalid video url passed - {url}")
 
 
+def get_playlist_url(url: str) -> str:
+    """Normalizes youtube playlist url
+
+    Args:
+        url (str): Youtube playlist url/id
+
+    Raises:
+       InvalidPlaylistUrl : Incase url is invalid.
+
+    Returns:
+        str: playlist url
+    """
+    for compiled_pattern in compiled_playlist_id_patterns:
+        match = compiled_pattern.match(url)
+        if match:
+            return f"https://www.youtube.com/playlist?list={match.group(1)}"
+    raise InvalidPlaylistUrl(f"Invalid playlist url passed - {url}")
+
+
+def get_channel_url(url: str) -> str:
+    """Normalizes youtube channel url to that of its videos tab
+
+    Args:
+        url (str): Youtube channel url/handle/id
+
+    Raises:
+       InvalidPlaylistUrl : Incase url is invalid.
+
+    Returns:
+        str: channel videos url
+    """
+    for compiled_pattern in compiled_channel_path_patterns:
+        match = compiled_pattern.match(url)
+        if match:
+            path = match.group(1)
+            if path.startswith("UC"):
+                path = f"channel/{path}"
+            return f"https://www.youtube.com/{path}/videos"
+    raise InvalidPlaylistUrl(f"Invalid channel url passed - {url}")
+
+
 def get_absolute_link_to_static_file(
     filename: str, request: t.Union[Request, WebSocket]
 ):
@@ -136,6 +230,15 @@ def get_absolute_link_to_static_file(
         )
 
 
+def get_client_id(request: t.Union[Request, WebSocket]) -> str:
+    """Identify the client behind a request for fair-share purposes.
+    X-Forwarded-For is only trusted when the server is behind a proxy."""
+    forwarded_for = request.headers.get("X-Forwarded-For")
+    if forwarded_for and loaded_config.trust_forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
 def silence_websocket_exceptions(func):
     """Exception handler for websockets. Makes them die in peace."""
     if isinstance(func, t.Coroutine):
@@ -0,0 +1,327 @@
+"""Media download execution.
+
+Downloads run either in the calling thread or, when `download_executor` is
+set to `process`, in a pool of worker processes each owning its own
+`YoutubeDLBonus` and `Downloader` instances.
+"""
+
+import typing as t
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from threading import BoundedSemaphore, Event, Lock, Thread
+from uuid import uuid4
+from yt_dlp.utils import DownloadError
+from yt_dlp_bonus import YoutubeDLBonus, Downloader
+from yt_dlp_bonus.models import ExtractedInfo
+from yt_dlp_bonus.constants import audioQualities, videoQualities
+from app.config import loaded_config, download_dir, temp_dir
+from app.utils import sanitize_filename, logger
+from app.v1.ranges import register_parallel_http_downloader
+from app.v1.merging import register_merged_streams_downloader
+import app.v1.models as models
+
+yt_params = loaded_config.ytdlp_params
+
+yt_params.update({"paths": {"home": download_dir.as_posix(), "temp": temp_dir.name}})
+
+if loaded_config.download_engine == "parallel":
+    register_parallel_http_downloader()
+    yt_params["concurrent_fragment_downloads"] = max(
+        loaded_config.concurrent_fragment_downloads or 1,
+        loaded_config.download_range_max_connections,
+    )
+
+if loaded_config.parallel_merged_streams:
+    register_merged_streams_downloader()
+
+yt = YoutubeDLBonus(params=yt_params)
+
+downloader = Downloader(
+    yt=yt,
+    working_directory=download_dir,
+    clear_temps=loaded_config.clear_temps,
+    filename_prefix=loaded_config.filename_prefix,
+)
+
+
+def get_output_template(
+    extracted_info: ExtractedInfo, payload: models.MediaDownloadProcessPayload
+) -> str:
+    """yt-dlp output template (`outtmpl`) of the file a download request produces"""
+    # Identical names would make different downloads overwrite one another
+    name_variants = []
+    if payload.bitrate and payload.quality not in videoQualities:
+        name_variants.append(payload.bitrate)
+    if loaded_config.embed_subtitles and payload.x_lang is not None:
+        name_variants.append(payload.x_lang)
+    title = sanitize_filename(extracted_info.title).replace("%", "%%")
+    return (
+        f"{(loaded_config.filename_prefix or '').replace('%', '%%')}{title} "
+        f"(%(format_note)s{''.join(', ' + variant for variant in name_variants)}"
+        f"{', %(id)s' if loaded_config.append_id_in_filename else ''}).%(ext)s"
+    )
+
+
+def download_media(
+    extracted_info: ExtractedInfo,
+    payload: models.MediaDownloadProcessPayload,
+    progress_hooks: list[t.Callable] = [],
+    **kwargs,
+) -> Path:
+    """Download media as per payload and return path to the produced file"""
+    video_formats = yt.get_video_qualities_with_extension(
+        extracted_info,
+        ext=loaded_config.default_extension,
+        audio_ext=(
+            loaded_config.default_audio_format
+            if payload.quality in audioQualities
+            else "webm"
+        ),
+    )
+    target_format = video_formats.get(payload.quality)
+
+    ytdl_opts = {"outtmpl": get_output_template(extracted_info, payload)}
+
+    if loaded_config.embed_subtitles and payload.x_lang is not None:
+        ytdl_opts.update(
+            {
+                "postprocessors": [
+                    {"already_have_subtitle": False, "key": "FFmpegEmbedSubtitle"}
+                ],
+                "writeautomaticsub": True,
+                "writesubtitles": True,
+                "subtitleslangs": [payload.x_lang],
+            }
+        )
+
+    kwargs["ytdl_params"] = ytdl_opts
+
+    if payload.quality in audioQualities:
+        assert target_format, (
+            f"The video does not support the audio quality '{payload.quality}'. "
+            f"Try other audio qualities like {', '.join([quality for quality in audioQualities if quality != payload.quality])}."
+        )
+        processed_info_dict = downloader.ydl_run_audio(
+            extracted_info,
+            audio_format=target_format.format_id,
+            bitrate=payload.bitrate,
+            progress_hooks=progress_hooks,
+            **kwargs,
+        )
+    elif payload.quality in videoQualities:
+        assert target_format, (
+            f"The video does not support the video quality '{payload.quality}'. "
+            f"Try other video qualities like {', '.join([quality for quality in videoQualities if quality != payload.quality])}."
+        )
+        processed_info_dict = downloader.ydl_run_video(
+            extracted_info,
+            video_format=target_format.format_id,
+            output_ext="mp4",
+            progress_hooks=progress_hooks,
+            **kwargs,
+        )
+        # TODO: Consider audio_format as well
+    else:
+        # bestaudio | bestvideo | best
+        if payload.bitrate:
+            # audio
+            processed_info_dict = downloader.ydl_run_audio(
+                extracted_info,
+                payload.bitrate,
+                audio_format=payload.quality,
+                progress_hooks=progress_hooks,
+                **kwargs,
+            )
+        else:
+            processed_info_dict = downloader.ydl_run(
+                extracted_info,
+                video_format=None,
+                audio_format=None,
+                default_format=payload.quality,
+                progress_hooks=progress_hooks,
+                **kwargs,
+            )
+
+    return Path(processed_info_dict["requested_downloads"][0]["filepath"])
+
+
+progress_event_keys = (
+    "status",
+    "filename",
+    "tmpfilename",
+    "downloaded_bytes",
+    "total_bytes",
+    "total_bytes_estimate",
+    "speed",
+    "eta",
+    "elapsed",
+    "fragment_index",
+    "fragment_count",
+    "stream",
+)
+"""Progress hook entries relayed from worker processes"""
+
+_worker_progress_events: multiprocessing.Queue = None
+
+
+def _init_worker_process(progress_events: multiprocessing.Queue):
+    global _worker_progress_events
+    _worker_progress_events = progress_events
+
+
+def _download_in_worker_process(
+    task_id: str,
+    extracted_info: ExtractedInfo,
+    payload: models.MediaDownloadProcessPayload,
+    kwargs: dict,
+) -> Path:
+    """Entry point of a download in a worker process"""
+
+    def progress_hook(d: dict):
+        _worker_progress_events.put(
+            (task_id, {key: d[key] for key in progress_event_keys if key in d})
+        )
+
+    try:
+        return download_media(
+            extracted_info, payload, progress_hooks=[progress_hook], **kwargs
+        )
+    except DownloadError as e:
+        # exc_info of the original cannot be pickled back to the parent
+        raise DownloadError(e.msg) from None
+    finally:
+        _worker_progress_events.put((task_id, None))
+
+
+class ProcessDownloader:
+    """Runs downloads in a pool of worker processes and relays their
+    progress events to the hooks of the respective callers"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        # spawn and forkserver would re-execute the server's entry script in
+        # every worker, so workers are forked, all at once, by `start`.
+        self._context = multiprocessing.get_context("fork")
+        self._progress_events: multiprocessing.Queue = None
+        self._pool: ProcessPoolExecutor = None
+        self._tasks: dict[str, tuple[list[t.Callable], Event]] = {}
+        self._lock = Lock()
+        self._broken = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._pool is not None
+
+    def start(self) -> t.NoReturn:
+        """Fork the worker processes. Call it before any other thread is
+        started to keep the forked processes free of held locks.
+
+        A pool that broke is never forked again, as by then the server
+        is running threads."""
+        with self._lock:
+            if self._pool is not None or self._broken:
+                return
+            self._progress_events = self._context.Queue()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=self._context,
+                initializer=_init_worker_process,
+                initargs=(self._progress_events,),
+            )
+            # Forked processes are all launched on the first submission
+            self._pool.submit(int).result()
+            Thread(
+                target=self._relay_progress,
+                args=(self._progress_events,),
+                name="download-progress-relay",
+                daemon=True,
+            ).start()
+
+    def _relay_progress(self, progress_events: multiprocessing.Queue):
+        while True:
+            event = progress_events.get()
+            if event is None:
+                return
+            task_id, d = event
+            task = self._tasks.get(task_id)
+            if task is None:
+                continue
+            hooks, completed = task
+            if d is None:
+                completed.set()
+                continue
+            for hook in hooks:
+                try:
+                    hook(d)
+                except Exception as e:
+                    logger.error(f"Exception on progress hook ({hook.__name__}) - {e}")
+
+    def download(
+        self,
+        extracted_info: ExtractedInfo,
+        payload: models.MediaDownloadProcessPayload,
+        progress_hooks: list[t.Callable] = [],
+        **kwargs,
+    ) -> Path:
+        """Download media in a worker process and wait for it.
+        Raises `BrokenProcessPool` unless the pool is running."""
+        pool = self._pool
+        if pool is None:
+            raise BrokenProcessPool("Download worker processes are not running")
+        task_id = uuid4().hex
+        completed = Event()
+        self._tasks[task_id] = (progress_hooks, completed)
+        try:
+            future = pool.submit(
+                _download_in_worker_process, task_id, extracted_info, payload, kwargs
+            )
+            filepath = future.result()
+            # Let the relay deliver the last events before detaching the hooks
+            completed.wait(5)
+            return filepath
+        except BrokenProcessPool:
+            logger.error(
+                "Download worker process died. "
+                "Further downloads are processed in threads."
+            )
+            self._broken = True
+            self.shutdown()
+            raise
+        finally:
+            self._tasks.pop(task_id, None)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is None:
+                return
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._progress_events.put(None)
+            self._pool = None
+
+
+process_downloader = ProcessDownloader(workers=loaded_config.download_workers)
+
+download_slots = BoundedSemaphore(loaded_config.download_workers)
+"""Downloads allowed to run at once across jobs and playlist entries"""
+
+
+def run_download(
+    extracted_info: ExtractedInfo,
+    payload: models.MediaDownloadProcessPayload,
+    progress_hooks: list[t.Callable] = [],
+    **kwargs,
+) -> Path:
+    """Download media in the worker processes while they are running, from
+    startup when `download_executor` is `process` until the pool breaks, and
+    in the calling thread otherwise.
+
+    Playlist entries are downloaded alongside the queued jobs, so runs of
+    yt-dlp are bounded by `download_slots` rather than the job workers."""
+    with download_slots:
+        if process_downloader.is_running:
+            return process_downloader.download(
+                extracted_info, payload, progress_hooks, **kwargs
+            )
+        return download_media(extracted_info, payload, progress_hooks, **kwargs)
@@ -0,0 +1,238 @@
+"""Background download jobs executed by a bounded pool of workers"""
+
+import typing as t
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from datetime import datetime
+from threading import Condition, Thread
+from uuid import uuid4
+from fastapi import HTTPException, Request, WebSocket
+from app.exceptions import DownloadQueueFull, DownloadQueueStopped
+from app.utils import logger, utc_now, _to_http_exception
+from app.v1.utils import ProgressBroadcaster
+import app.v1.models as models
+
+
+class DownloadJob:
+    """A download request and its execution state"""
+
+    def __init__(
+        self,
+        client: str,
+        request: t.Union[Request, WebSocket],
+        payload: models.MediaDownloadProcessPayload,
+        handler: t.Callable[..., models.MediaDownloadResponse] = None,
+    ):
+        self.id: str = uuid4().hex
+        self.client = client
+        self.request = request
+        self.payload = payload
+        self.handler = handler
+        """Executes the job in place of the queue's handler"""
+        self.status: t.Literal["queued", "running", "done", "failed"] = "queued"
+        self.created_on: datetime = utc_now()
+        self.started_on: datetime = None
+        self.finished_on: datetime = None
+        self.future: Future = Future()
+        self.progress = ProgressBroadcaster()
+        """Relays the job's yt-dlp progress events to subscribers"""
+
+    @property
+    def error(self) -> dict | None:
+        """Status code and detail of a failed job"""
+        if self.status != "failed":
+            return
+        e = self.future.exception()
+        if isinstance(e, HTTPException):
+            return dict(status_code=e.status_code, detail=e.detail)
+        return dict(
+            status_code=500,
+            detail="Server encountered an issue while trying to handle that request!",
+        )
+
+    def to_response(self) -> models.DownloadJobResponse:
+        return models.DownloadJobResponse(
+            id=self.id,
+            status=self.status,
+            created_on=self.created_on,
+            started_on=self.started_on,
+            finished_on=self.finished_on,
+            result=self.future.result() if self.status == "done" else None,
+            error=self.error,
+        )
+
+
+class DownloadJobQueue:
+    """Queue of download jobs served by a fixed number of worker threads.
+
+    Clients are served round-robin so that one client cannot starve the rest,
+    and submissions beyond the queue limits are rejected with `DownloadQueueFull`.
+    """
+
+    def __init__(
+        self,
+        handler: t.Callable[..., models.MediaDownloadResponse],
+        workers: int,
+        max_queued: int,
+        max_queued_per_client: int,
+        retention_in_secs: int,
+    ):
+        """`DownloadJobQueue` Constructor
+
+        Args:
+            handler (t.Callable): Executes a job. Receives `request`, `payload` and `progress_hooks`.
+            workers (int): Jobs to execute concurrently.
+            max_queued (int): Jobs allowed to wait for a worker.
+            max_queued_per_client (int): Jobs a single client is allowed to have waiting.
+            retention_in_secs (int): Time to keep finished jobs for status queries.
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_queued_per_client = max_queued_per_client
+        self.retention_in_secs = retention_in_secs
+        self._jobs: dict[str, DownloadJob] = {}
+        self._queues: OrderedDict[str, deque[DownloadJob]] = OrderedDict()
+        self._queued = 0
+        self._condition = Condition()
+        self._threads: list[Thread] = []
+        self._running = False
+        self._stopped = False
+
+    def start(self) -> t.NoReturn:
+        """Spawn the workers unless the queue has been stopped"""
+        with self._condition:
+            if self._running or self._stopped:
+                return
+            self._running = True
+            self._threads = [
+                Thread(target=self._work, name=f"download-worker-{index}", daemon=True)
+                for index in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> t.NoReturn:
+        """Let the workers exit once their current job is done and fail the
+        jobs still queued. Later submissions are refused."""
+        with self._condition:
+            self._running = False
+            self._stopped = True
+            queued_jobs = [
+                job for client_queue in self._queues.values() for job in client_queue
+            ]
+            self._queues.clear()
+            self._queued = 0
+            self._condition.notify_all()
+        for job in queued_jobs:
+            job.status = "failed"
+            job.finished_on = utc_now()
+            job.future.set_exception(
+                _to_http_exception(
+                    DownloadQueueStopped("Server is shutting down. Try again later.")
+                )
+            )
+
+    def submit(
+        self,
+        client: str,
+        request: t.Union[Request, WebSocket],
+        payload: models.MediaDownloadProcessPayload,
+        handler: t.Callable[..., models.MediaDownloadResponse] = None,
+    ) -> DownloadJob:
+        """Queue a download job
+
+        Args:
+            client (str): Identifier of the client queueing the job.
+            request (t.Union[Request, WebSocket]): Request the job was made in.
+            payload (models.MediaDownloadProcessPayload): Download details.
+            handler (t.Callable, optional): Executes the job in place of the
+                queue's handler e.g for other kinds of downloads. Defaults to None.
+
+        Raises:
+            DownloadQueueFull: When the queue or the client's share of it is full.
+            DownloadQueueStopped: When the queue has been stopped.
+        """
+        self.start()
+        job = DownloadJob(client, request, payload, handler)
+        with self._condition:
+            if self._stopped:
+                raise DownloadQueueStopped("Server is shutting down. Try again later.")
+            self._prune_finished_jobs()
+            if self._queued >= self.max_queued:
+                raise DownloadQueueFull(
+                    "Server is handling too many downloads. Try again later."
+                )
+            client_queue = self._queues.setdefault(client, deque())
+            if len(client_queue) >= self.max_queued_per_client:
+                raise DownloadQueueFull(
+                    f"You have reached the limit of {self.max_queued_per_client} "
+                    "queued downloads. Wait for them to complete."
+                )
+            client_queue.append(job)
+            self._queued += 1
+            self._jobs[job.id] = job
+            self._condition.notify()
+        return job
+
+    def get(self, job_id: str) -> DownloadJob | None:
+        """Get a job that has not been pruned"""
+        return self._jobs.get(job_id)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        with self._condition:
+            running = sum(job.status == "running" for job in self._jobs.values())
+            return dict(
+                workers=self.workers,
+                queued=self._queued,
+                running=running,
+                clients=len(self._queues),
+            )
+
+    def _next_job(self) -> DownloadJob:
+        """Pop job of the least recently served client. Caller holds the lock."""
+        client, client_queue = next(iter(self._queues.items()))
+        job = client_queue.popleft()
+        if client_queue:
+            self._queues.move_to_end(client)
+        else:
+            del self._queues[client]
+        self._queued -= 1
+        return job
+
+    def _prune_finished_jobs(self):
+        now = utc_now()
+        for job_id, job in list(self._jobs.items()):
+            if (
+                job.finished_on
+                and (now - job.finished_on).total_seconds() > self.retention_in_secs
+            ):
+                del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while self._running and not self._queued:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                job = self._next_job()
+                job.status = "running"
+                job.started_on = utc_now()
+            try:
+                result = (job.handler or self.handler)(
+                    request=job.request,
+                    payload=job.payload,
+                    progress_hooks=[job.progress],
+                )
+            except BaseException as e:
+                if not isinstance(e, HTTPException):
+                    logger.exception(e)
+                job.status = "failed"
+                job.finished_on = utc_now()
+                job.future.set_exception(e)
+            else:
+                job.status = "done"
+                job.finished_on = utc_now()
+                job.future.set_result(result)
@@ -0,0 +1,95 @@
+"""Concurrent fetching of the streams making up merged formats.
+
+yt-dlp downloads the video and audio streams of a merged format one after the
+other unless a single downloader can take them all. `MergedStreamsFD` is such
+a downloader: it fetches every stream at once, each with the downloader yt-dlp
+would have used for it, and yt-dlp merges them as soon as it returns.
+"""
+
+import importlib
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+import yt_dlp.downloader
+from yt_dlp.downloader import FFmpegFD
+from yt_dlp.downloader.common import FileDownloader
+from yt_dlp.utils import NO_DEFAULT
+
+youtube_dl_module = importlib.import_module("yt_dlp.YoutubeDL")
+"""Module whose downloader lookups are extended"""
+
+get_stream_downloader = yt_dlp.downloader.get_suitable_downloader
+"""yt-dlp's downloader lookup"""
+
+
+def get_stream_kind(format: dict) -> t.Literal["video", "audio"]:
+    return "audio" if format.get("vcodec") in (None, "none") else "video"
+
+
+class MergedStreamsFD(FileDownloader):
+    """Downloads the streams of a merged format concurrently.
+
+    Progress events of each stream carry a `stream` entry - `video` or
+    `audio` - telling them apart.
+    """
+
+    FD_NAME = "merged-streams"
+
+    @classmethod
+    def can_download(cls, info_dict: dict, params: dict) -> bool:
+        requested_formats = info_dict.get("requested_formats") or []
+        return len(requested_formats) > 1 and all(
+            get_stream_downloader(format, params) not in (None, FFmpegFD)
+            for format in requested_formats
+        )
+
+    def real_download(self, filename: str, info_dict: dict) -> bool:
+        requested_formats = info_dict["requested_formats"]
+        with ThreadPoolExecutor(
+            max_workers=len(requested_formats), thread_name_prefix="stream-download"
+        ) as executor:
+            futures = [
+                executor.submit(self._download_stream, info_dict, format)
+                for format in requested_formats
+            ]
+            return all([future.result() for future in futures])
+
+    def _download_stream(self, info_dict: dict, format: dict) -> bool:
+        stream_info = {**info_dict, **format}
+        del stream_info["requested_formats"]
+        stream = get_stream_kind(format)
+
+        def progress_hook(d: dict):
+            d["stream"] = stream
+            for hook in self._progress_hooks:
+                hook(d)
+
+        downloader = get_stream_downloader(stream_info, self.params)(
+            self.ydl, self.params
+        )
+        downloader.add_progress_hook(progress_hook)
+        success, _ = downloader.download(format["filepath"], stream_info)
+        return success
+
+
+def get_suitable_downloader(
+    info_dict: dict,
+    params: dict = {},
+    default: t.Any = NO_DEFAULT,
+    protocol: str = None,
+    to_stdout: bool = False,
+):
+    """`yt_dlp.downloader.get_suitable_downloader` that takes merged formats
+    whose streams can be downloaded separately to `MergedStreamsFD`"""
+    if (
+        protocol is None
+        and not to_stdout
+        and not (info_dict.get("section_start") or info_dict.get("section_end"))
+        and MergedStreamsFD.can_download(info_dict, params)
+    ):
+        return MergedStreamsFD
+    return get_stream_downloader(info_dict, params, default, protocol, to_stdout)
+
+
+def register_merged_streams_downloader() -> t.NoReturn:
+    """Make yt-dlp download the streams of merged formats concurrently"""
+    youtube_dl_module.get_suitable_downloader = get_suitable_downloader
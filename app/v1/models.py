@@ -1,5 +1,7 @@
 from pydantic import BaseModel, Field, HttpUrl
 from typing import Optional, Literal
+from datetime import datetime
+from app.config import loaded_config
 from yt_dlp_bonus.constants import (
     mediaQualitiesType,
     audioBitratesType,
@@ -16,6 +18,9 @@ class SearchVideosResponse(BaseModel):
 
     query: str = Field(description="Search query")
     results: list[VideoMetadata]
+    next: Optional[str] = Field(
+        None, description="Cursor for fetching the results that follow"
+    )
 
     model_config = {
         "json_schema_extra": {
@@ -73,6 +78,7 @@ class SearchVideosResponse(BaseModel):
                         "duration": "1:00:58",
                     },
                 ],
+                "next": "WyJFcE1EUy4uLiIsIDEwXQ==",
             }
         }
     }
@@ -134,6 +140,71 @@ class VideoMetadataResponse(BaseModel):
     }
 
 
+class PlaylistResponse(BaseModel):
+    id: str = Field(description="Playlist or channel id")
+    title: Optional[str] = None
+    channel: Optional[str] = None
+    entries: list[SearchVideosResponse.VideoMetadata] = Field(
+        description="Videos in the playlist or channel"
+    )
+    warming_up: int = Field(
+        0, description="Videos whose info is being extracted in the background"
+    )
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "id": "PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG",
+                "title": "Diamond Platnumz Hits",
+                "channel": "Diamond Platnumz",
+                "entries": [
+                    {
+                        "title": "Diamond Platnumz - Jeje (Official Music Video)",
+                        "id": "g5rFro4XdZ0",
+                        "duration": "3:19",
+                    },
+                ],
+                "warming_up": 1,
+            }
+        }
+    }
+
+
+class VideoMetadataBatchPayload(BaseModel):
+    urls: list[str] = Field(
+        min_length=1,
+        max_length=loaded_config.metadata_batch_limit,
+        description="Links to the Youtube videos or video ids",
+    )
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "urls": [
+                    "https://youtu.be/lw5tB9LQQVM",
+                    "1-xGerv5FOk",
+                ]
+            }
+        }
+    }
+
+
+class VideoMetadataBatchItem(BaseModel):
+    class ItemError(BaseModel):
+        status_code: int
+        detail: str
+
+    url: str = Field(description="Link or video id as requested")
+    metadata: Optional[VideoMetadataResponse] = None
+    error: Optional[ItemError] = None
+
+
+class VideoMetadataBatchResponse(BaseModel):
+    results: list[VideoMetadataBatchItem] = Field(
+        description="Metadata or error of each video in the order requested"
+    )
+
+
 class MediaDownloadProcessPayload(BaseModel):
     url: str = Field(description="Link to the Youtube video or video id")
     quality: mediaQualitiesType | Literal["bestaudio", "bestvideo", "best"]
@@ -164,6 +235,26 @@ class MediaDownloadProcessPayload(BaseModel):
     }
 
 
+class PlaylistDownloadProcessPayload(MediaDownloadProcessPayload):
+    url: str = Field(description="Link to the Youtube playlist or playlist id")
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "url": "https://www.youtube.com/playlist?list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG",
+                    "quality": "medium",
+                    "bitrate": "128k",
+                },
+                {
+                    "url": "PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG",
+                    "quality": "720p",
+                },
+            ],
+        }
+    }
+
+
 class MediaDownloadResponse(BaseModel):
     is_success: bool = Field(description="Download successful status")
     filename: Optional[str] = None
@@ -182,3 +273,38 @@ class MediaDownloadResponse(BaseModel):
             }
         }
     }
+
+
+class DownloadJobResponse(BaseModel):
+    class JobError(BaseModel):
+        status_code: int
+        detail: str
+
+    id: str = Field(description="Job id")
+    status: Literal["queued", "running", "done", "failed"]
+    created_on: datetime
+    started_on: Optional[datetime] = None
+    finished_on: Optional[datetime] = None
+    result: Optional[MediaDownloadResponse] = Field(
+        None, description="Download details once the job is done"
+    )
+    error: Optional[JobError] = Field(None, description="Reason the job failed")
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "id": "0b8e2c1d7f4a4b0e9d3c5a6f1e2d3c4b",
+                "status": "done",
+                "created_on": "2025-01-01T10:00:00",
+                "started_on": "2025-01-01T10:00:01",
+                "finished_on": "2025-01-01T10:00:09",
+                "result": {
+                    "is_success": True,
+                    "filename": "Alan Walker - Alone 1080p.mp4",
+                    "filesize": "35.37 MB",
+                    "link": "//localhost:8000/static/file/Alan%20Walker%20-%20Alone%201080p.mp4",
+                },
+                "error": None,
+            }
+        }
+    }
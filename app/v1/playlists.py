@@ -0,0 +1,72 @@
+"""Listing of videos in youtube playlists and channels"""
+
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import formatSeconds
+from app.cache import TTLCache, SingleFlight
+from app.config import loaded_config
+
+flat_yt = YoutubeDL(
+    params={
+        **loaded_config.ytdlp_params,
+        "extract_flat": "in_playlist",
+        "playlistend": loaded_config.playlist_entries_limit,
+    }
+)
+"""Lists playlist entries without extracting each video"""
+
+playlists_cache = TTLCache(
+    "playlists",
+    maxsize=128,
+    ttl=loaded_config.playlist_cache_ttl_in_secs,
+)
+"""Listed playlists keyed by their normalized url"""
+
+playlist_flight = SingleFlight()
+"""Concurrent listings of a playlist share one extraction"""
+
+
+def expand_playlist(url: str) -> dict:
+    """Get a playlist or channel along with its videos.
+
+    Args:
+        url (str): Normalized playlist or channel videos url.
+
+    Returns:
+        dict: Playlist id, title, channel and entries - shallow metadata of
+            its videos in order.
+    """
+    playlist = playlists_cache.get(url)
+    if playlist is not None:
+        return playlist
+    return playlist_flight.do(url, load_playlist, url)
+
+
+def load_playlist(url: str) -> dict:
+    """List the videos in a playlist from youtube and cache them in memory"""
+    raw_info = flat_yt.extract_info(url, download=False)
+    entries = []
+    for entry in raw_info.get("entries") or []:
+        if entry.get("ie_key") != "Youtube" or not entry.get("id"):
+            # Nested playlists e.g channel tabs
+            continue
+        title = entry.get("title") or ""
+        if not entry.get("duration") and title.startswith("["):
+            # [Private video], [Deleted video]
+            continue
+        entries.append(
+            dict(
+                id=entry["id"],
+                title=title,
+                duration=(
+                    formatSeconds(entry["duration"]) if entry.get("duration") else None
+                ),
+            )
+        )
+    playlist = dict(
+        id=raw_info.get("id"),
+        title=raw_info.get("title"),
+        channel=raw_info.get("channel") or raw_info.get("uploader"),
+        entries=entries,
+    )
+    playlists_cache.set(url, playlist)
+    return playlist
@@ -0,0 +1,252 @@
+"""Parallel byte-range downloads of media streams.
+
+Youtube caps the throughput of each connection, so large streams are fetched
+as several byte ranges at once. Ranges are written in place into a file
+preallocated to the stream's size, hence no reassembly is needed.
+"""
+
+import os
+import time
+import typing as t
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+import httpx
+import yt_dlp.downloader
+from yt_dlp.downloader.http import HttpFD
+from app.config import loaded_config
+
+initial_connections = 2
+"""Parallel range requests a download starts with"""
+
+throttling_status_codes = (429, 503)
+
+range_client = httpx.Client(
+    proxies=loaded_config.proxy or None,
+    timeout=httpx.Timeout(30),
+    limits=httpx.Limits(
+        max_connections=None,
+        max_keepalive_connections=loaded_config.download_range_max_connections
+        * loaded_config.download_workers,
+    ),
+    follow_redirects=True,
+)
+"""Pooled client for fetching byte ranges of media streams"""
+
+
+class RangesNotSupported(Exception):
+    """Server responded to a range request with the whole content"""
+
+
+class ConcurrencyController:
+    """Adapts the number of parallel range requests to the observed throughput.
+
+    Concurrency grows by one after every round of requests that improves the
+    best aggregate throughput by more than 10%, drops by one when throughput
+    falls below half of the best and is halved when requests get throttled.
+    """
+
+    def __init__(self, initial: int, maximum: int):
+        """`ConcurrencyController` Constructor
+
+        Args:
+            initial (int): Parallel requests to start with.
+            maximum (int): Parallel requests never to exceed.
+        """
+        self.maximum = maximum
+        self.concurrency = min(initial, maximum)
+        self.best_throughput = 0.0
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_started_at = time.monotonic()
+        self._window_bytes = 0
+        self._window_requests = 0
+
+    def completed(self, nbytes: int) -> t.NoReturn:
+        """Note a request that fetched `nbytes`"""
+        self._window_bytes += nbytes
+        self._window_requests += 1
+        if self._window_requests < self.concurrency:
+            return
+        throughput = self._window_bytes / max(
+            time.monotonic() - self._window_started_at, 1e-6
+        )
+        if throughput > self.best_throughput * 1.1:
+            self.best_throughput = throughput
+            self.concurrency = min(self.concurrency + 1, self.maximum)
+        elif throughput < self.best_throughput / 2:
+            self.concurrency = max(self.concurrency - 1, 1)
+        self._reset_window()
+
+    def throttled(self) -> t.NoReturn:
+        """Back off after a request was refused or timed out"""
+        self.concurrency = max(self.concurrency // 2, 1)
+        self._reset_window()
+
+
+def fetch_range(
+    url: str, http_headers: dict[str, str], fd: int, start: int, end: int
+) -> tuple[int, int]:
+    """Fetch a byte range of url into the open file `fd` at the same offset.
+
+    Returns:
+        tuple[int, int]: Bytes written and the size of the whole content.
+
+    Raises:
+        RangesNotSupported: Server ignored the range or did not report the
+            content's size.
+    """
+    written = 0
+    with range_client.stream(
+        "GET", url, headers={**http_headers, "Range": f"bytes={start}-{end}"}
+    ) as response:
+        response.raise_for_status()
+        total = response.headers.get("content-range", "").split("/")[-1]
+        if response.status_code != 206 or not total.isdigit():
+            raise RangesNotSupported(url)
+        total = int(total)
+        for chunk in response.iter_bytes():
+            os.pwrite(fd, chunk, start + written)
+            written += len(chunk)
+    if written != min(end, total - 1) - start + 1:
+        raise httpx.ReadError(
+            f"Range {start}-{end} ended after {written} bytes",
+            request=response.request,
+        )
+    return written, total
+
+
+class ParallelHttpFD(HttpFD):
+    """Downloads http(s) streams as parallel byte ranges.
+
+    Live streams and those whose server does not support ranges are
+    downloaded by yt-dlp's `HttpFD` as usual.
+    """
+
+    FD_NAME = "parallel-http"
+
+    def real_download(self, filename: str, info_dict: dict) -> bool:
+        if filename == "-" or info_dict.get("is_live"):
+            return super().real_download(filename, info_dict)
+
+        url = info_dict["url"]
+        http_headers = info_dict.get("http_headers") or {}
+        chunk_size = loaded_config.download_range_chunk_size
+        tmpfilename = self.temp_name(filename)
+        started_at = time.monotonic()
+        fd = os.open(tmpfilename, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            downloaded, total = fetch_range(url, http_headers, fd, 0, chunk_size - 1)
+        except (RangesNotSupported, httpx.HTTPError):
+            # HttpFD has its own retries
+            os.close(fd)
+            self.try_remove(tmpfilename)
+            return super().real_download(filename, info_dict)
+
+        def report_progress(written: int):
+            nonlocal downloaded
+            downloaded += written
+            now = time.monotonic()
+            self._hook_progress(
+                {
+                    "status": "downloading",
+                    "downloaded_bytes": downloaded,
+                    "total_bytes": total,
+                    "filename": filename,
+                    "tmpfilename": tmpfilename,
+                    "elapsed": now - started_at,
+                    "speed": self.calc_speed(started_at, now, downloaded),
+                    "eta": self.calc_eta(started_at, now, total, downloaded),
+                },
+                info_dict,
+            )
+
+        self.report_destination(filename)
+        try:
+            os.ftruncate(fd, total)
+            self._download_ranges(
+                url,
+                http_headers,
+                fd,
+                deque(
+                    (start, min(start + chunk_size, total) - 1, 0)
+                    for start in range(downloaded, total, chunk_size)
+                ),
+                report_progress,
+            )
+        except Exception as e:
+            self.try_remove(tmpfilename)
+            self.report_error(f"unable to download video data: {e}")
+            return False
+        finally:
+            os.close(fd)
+
+        self.try_rename(tmpfilename, filename)
+        self._hook_progress(
+            {
+                "downloaded_bytes": total,
+                "total_bytes": total,
+                "filename": filename,
+                "status": "finished",
+                "elapsed": time.monotonic() - started_at,
+            },
+            info_dict,
+        )
+        return True
+
+    def _download_ranges(
+        self,
+        url: str,
+        http_headers: dict[str, str],
+        fd: int,
+        ranges: deque[tuple[int, int, int]],
+        on_progress: t.Callable[[int], t.Any],
+    ):
+        """Fetch the ranges keeping as many in flight as the controller allows.
+
+        Failed ranges are retried up to `retries` times each. `on_progress` is
+        called with the bytes fetched by each range.
+        """
+        controller = ConcurrencyController(
+            initial_connections, loaded_config.download_range_max_connections
+        )
+        retries = self.params.get("retries") or 0
+        in_flight: dict[Future, tuple[int, int, int]] = {}
+        with ThreadPoolExecutor(
+            max_workers=controller.maximum, thread_name_prefix="range-download"
+        ) as executor:
+            try:
+                while ranges or in_flight:
+                    while ranges and len(in_flight) < controller.concurrency:
+                        start, end, attempt = ranges.popleft()
+                        future = executor.submit(
+                            fetch_range, url, http_headers, fd, start, end
+                        )
+                        in_flight[future] = (start, end, attempt)
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        start, end, attempt = in_flight.pop(future)
+                        try:
+                            written, _ = future.result()
+                        except httpx.HTTPError as e:
+                            if isinstance(e, httpx.TimeoutException) or (
+                                isinstance(e, httpx.HTTPStatusError)
+                                and e.response.status_code in throttling_status_codes
+                            ):
+                                controller.throttled()
+                            if attempt >= retries:
+                                raise
+                            ranges.appendleft((start, end, attempt + 1))
+                            continue
+                        controller.completed(written)
+                        on_progress(written)
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+
+def register_parallel_http_downloader() -> t.NoReturn:
+    """Make yt-dlp download http(s) streams with `ParallelHttpFD`"""
+    for protocol in ("http", "https"):
+        yt_dlp.downloader.PROTOCOL_MAP[protocol] = ParallelHttpFD
@@ -0,0 +1,102 @@
+"""Refreshing of popular videos' infos ahead of their expiry"""
+
+import typing as t
+from datetime import timedelta
+from threading import Event, Thread
+from sqlmodel import Session, select
+from yt_dlp_bonus import YoutubeDLBonus
+from app.config import loaded_config
+from app.db import VideoInfo, engine, video_info_cache_period
+from app.utils import logger, utc_now
+from app.v1.utils import pop_video_info_accesses, schedule_video_info_refresh
+
+
+class HotVideoInfoRefresher:
+    """Refreshes infos of frequently looked up videos shortly before they expire.
+
+    Lookups are counted per interval. Videos looked up at least `min_accesses`
+    times in the last interval whose info expires within `refresh_ahead_in_secs`
+    are refreshed in the background so that requests never wait on them.
+    """
+
+    def __init__(self, refresh_ahead_in_secs: int, min_accesses: int):
+        """`HotVideoInfoRefresher` Constructor
+
+        Args:
+            refresh_ahead_in_secs (int): Time before expiry to refresh infos.
+                0 disables refreshing.
+            min_accesses (int): Lookups within an interval that make a video hot.
+        """
+        self.refresh_ahead_in_secs = refresh_ahead_in_secs
+        self.min_accesses = min_accesses
+        self.interval_in_secs = max(refresh_ahead_in_secs / 2, 1)
+        self.yt: YoutubeDLBonus = None
+        self._stopped = Event()
+        self._thread: Thread = None
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.refresh_ahead_in_secs > 0
+
+    def start(self, yt: YoutubeDLBonus) -> t.NoReturn:
+        self.yt = yt
+        if not self.is_enabled or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = Thread(
+            target=self._run, name="hot-video-info-refresher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> t.NoReturn:
+        self._stopped.set()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval_in_secs):
+            try:
+                self.check()
+            except Exception as e:
+                logger.exception(e)
+
+    def check(self) -> list[str]:
+        """Schedule refreshes of hot videos whose info is about to expire.
+
+        Returns:
+            list[str]: Ids of the videos scheduled for refresh.
+        """
+        hot_video_ids = [
+            video_id
+            for video_id, count in pop_video_info_accesses().items()
+            if count >= self.min_accesses
+        ]
+        if not hot_video_ids:
+            return []
+        refresh_before = (
+            utc_now()
+            - video_info_cache_period
+            + timedelta(seconds=self.refresh_ahead_in_secs)
+        )
+        with Session(bind=engine) as session:
+            expiring_video_ids = session.exec(
+                select(VideoInfo.id).where(
+                    VideoInfo.id.in_(hot_video_ids),
+                    VideoInfo.updated_on < refresh_before,
+                )
+            ).all()
+        scheduled = [
+            video_id
+            for video_id in expiring_video_ids
+            if schedule_video_info_refresh(
+                self.yt, f"https://www.youtube.com/watch?v={video_id}", video_id
+            )
+        ]
+        if scheduled:
+            logger.info(f"Refreshing infos of {len(scheduled)} popular videos")
+        return scheduled
+
+
+hot_video_info_refresher = HotVideoInfoRefresher(
+    refresh_ahead_in_secs=loaded_config.video_info_refresh_ahead_in_secs,
+    min_accesses=loaded_config.video_info_hot_access_count,
+)
@@ -1,93 +1,167 @@
 from fastapi import APIRouter, Query, Request, WebSocket, Header
 from fastapi import status, HTTPException
 import app.v1.models as models
-from app.v1.utils import get_extracted_info
+from app.v1.utils import (
+    get_extracted_info,
+    get_downloadable_extracted_info,
+    get_cached_extracted_infos,
+    get_cached_video_summaries,
+    get_video_summary,
+    get_download_artifact_key,
+    get_download_artifact,
+    save_download_artifact,
+    download_once,
+    get_search_results,
+    encode_search_cursor,
+    decode_search_cursor,
+)
+from app.v1.jobs import DownloadJobQueue, DownloadJob
+from app.v1.downloads import yt, run_download, get_output_template
+from app.v1.streaming import stream_media
+from app.v1.search import search_videos_by_key
+from app.v1.playlists import expand_playlist
+from app.static import serve_static_file
+from app.storage import storage
 from app.utils import (
     router_exception_handler,
+    _to_http_exception,
+    get_video_id,
+    get_playlist_url,
+    get_channel_url,
+    sanitize_filename,
     get_absolute_link_to_static_file,
+    get_client_id,
     silence_websocket_exceptions,
-    sanitize_filename,
 )
-from app.config import loaded_config, download_dir, temp_dir
-from pathlib import Path
-from os import path
-from yt_dlp_bonus import YoutubeDLBonus, Downloader
-from yt_dlp_bonus.constants import audioQualities, videoQualities
+from app.config import loaded_config, download_dir
+from app.db import DownloadArtifact
+from app.exceptions import DownloadQueueFull
+from yt_dlp_bonus.constants import mediaQualitiesType
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from zipfile import ZipFile, ZIP_STORED
+from hashlib import sha1
+from uuid import uuid4
+from yt_dlp_bonus.exceptions import UserInputError
+import os
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from mimetypes import guess_type
+from urllib.parse import quote
+import httpx
 from yt_dlp_bonus.utils import get_size_string
-from functools import lru_cache
 import typing as t
 import asyncio
+import time
 from pydantic import ValidationError
 from app.models import CustomWebsocketResponse
 from app.utils import logger
 import json
 from starlette.websockets import WebSocketState
-from innertube import InnerTube
 from httpx import Proxy  # noqa: F401
 
 router = APIRouter(prefix="/v1")
 
-yt_params = loaded_config.ytdlp_params
-
-yt_params.update({"paths": {"home": download_dir.as_posix(), "temp": temp_dir.name}})
-
-yt = YoutubeDLBonus(params=yt_params)
-
-downloader = Downloader(
-    yt=yt,
-    working_directory=download_dir,
-    clear_temps=loaded_config.clear_temps,
-    filename_prefix=loaded_config.filename_prefix,
-)
-
-
-PARAMS_TYPE_VIDEO = "EgIQAQ%3D%3D"
-
-innertube_client = InnerTube(
-    "WEB",
-    "2.20230920.00.00",
-    # proxies=None if not loaded_config.proxy else Proxy(loaded_config.proxy),
+metadata_executor = ThreadPoolExecutor(
+    max_workers=loaded_config.metadata_batch_workers,
+    thread_name_prefix="metadata",
 )
+"""Bounds video infos being extracted for metadata batches and warm ups"""
 
 
-@lru_cache(maxsize=100)
-def search_videos_by_key(query: str, limit: int = -1) -> list[dict[str, str]]:
-    """Perform a video search.
+@router.get("/search", name="Search videos")
+@router_exception_handler
+async def search_videos(
+    q: str = Query(description="Video title or keyword"),
+    limit: int = Query(
+        10,
+        gt=0,
+        le=loaded_config.search_limit,
+        description="Videos amount not to exceed.",
+    ),
+    next: t.Optional[str] = Query(
+        None, description="Cursor of the results to fetch, as previously returned."
+    ),
+) -> models.SearchVideosResponse:
+    """Search videos
+    - Search videos matching the query and return whole results at once.
+    - Serves from cache queries differing only in case, spacing or limit.
+    - Pass `next` from the response to get the results that follow.
+    """
+    continuation, offset = decode_search_cursor(next) if next else (None, 0)
+    results, results_continuation = await get_search_results(
+        q, search_videos_by_key, continuation, limit=offset + limit
+    )
+    videos_found = results[offset : offset + limit]
+    if not videos_found:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No video matched that query - {q}!",
+        )
+    return models.SearchVideosResponse(
+        query=q,
+        results=videos_found,
+        next=get_next_search_cursor(
+            results, results_continuation, continuation, offset + limit
+        ),
+    )
 
-    Args:
-        query (str): Search keyword
-        limit (int): Total results not to exceed. Defaults to -1 (No limit).
 
-    Returns:
-        list[dict[str, str]]: Sorted shallow results.
-    """
-    video_search_results = innertube_client.search(query, params=PARAMS_TYPE_VIDEO)
-    video_metadata_container: list[dict] = []
-    contents = video_search_results["contents"]["twoColumnSearchResultsRenderer"][
-        "primaryContents"
-    ]["sectionListRenderer"]["contents"][0]["itemSectionRenderer"]["contents"]
-    count = 0
-    for content in contents:
-        try:
-            video = content["videoRenderer"]
-            video_id = video["videoId"]
-            video_title = video["title"]["runs"][0]["text"]
-            video_duration = video["lengthText"]["simpleText"]
-            video_metadata_container.append(
-                dict(id=video_id, title=video_title, duration=video_duration)
-            )
-            count += 1
-            if count == limit:
-                break
+def get_next_search_cursor(
+    results: list[dict[str, str]],
+    results_continuation: str | None,
+    continuation: str | None,
+    end: int,
+) -> str | None:
+    """Cursor of the results following `end` in a page of results starting
+    at `continuation`"""
+    if end < len(results):
+        return encode_search_cursor(continuation, end)
+    elif results_continuation:
+        return encode_search_cursor(results_continuation, 0)
+
+
+async def generate_search_results(
+    q: str, continuation: str | None, offset: int, limit: int
+) -> t.AsyncIterator[dict]:
+    """Yield videos matching query as each page of them is parsed, followed by
+    the cursor of the results that follow"""
+    pages = asyncio.Queue()
+
+    async def search(query: str, continuation: str | None, limit: int):
+        return await search_videos_by_key(
+            query, continuation, limit, on_page=pages.put_nowait
+        )
 
-        except Exception:  # KeyError etc
-            pass
-    return video_metadata_container
+    end = offset + limit
+    search_task = asyncio.ensure_future(
+        get_search_results(q, search, continuation, limit=end)
+    )
+    position = 0
+    while position < end:
+        next_page = asyncio.ensure_future(pages.get())
+        await asyncio.wait(
+            [next_page, search_task], return_when=asyncio.FIRST_COMPLETED
+        )
+        if not next_page.done():
+            # Search is complete or was served from cache
+            next_page.cancel()
+            break
+        videos = next_page.result()
+        for video in videos[max(offset - position, 0) : end - position]:
+            yield dict(video=video)
+        position += len(videos)
+
+    results, results_continuation = await search_task
+    for video in results[max(offset, position) : end]:
+        yield dict(video=video)
+    yield dict(
+        next=get_next_search_cursor(results, results_continuation, continuation, end)
+    )
 
 
-@router.get("/search", name="Search videos")
+@router.get("/search/stream", name="Stream search results")
 @router_exception_handler
-def search_videos(
+async def stream_search_videos(
     q: str = Query(description="Video title or keyword"),
     limit: int = Query(
         10,
@@ -95,78 +169,202 @@ def search_videos(
         le=loaded_config.search_limit,
         description="Videos amount not to exceed.",
     ),
-) -> models.SearchVideosResponse:
+    next: t.Optional[str] = Query(
+        None, description="Cursor of the results to fetch, as previously returned."
+    ),
+    format: t.Literal["ndjson", "sse"] = Query(
+        "ndjson", description="Newline delimited JSON or server-sent events."
+    ),
+) -> StreamingResponse:
     """Search videos
-    - Search videos matching the query and return whole results at once.
-    - Serves from cache similar `99` subsequent queries.
+    - Sends each video as soon as the page containing it is parsed, as a line of
+      `{"video": {...}}` (ndjson) or a `video` event (sse).
+    - Ends with the cursor of the results that follow, as a line of
+      `{"next": "..."}` (ndjson) or a `next` event (sse).
     """
-    videos_found = search_videos_by_key(query=q, limit=limit)
-    if not videos_found:
+    continuation, offset = decode_search_cursor(next) if next else (None, 0)
+    results = generate_search_results(q, continuation, offset, limit)
+    # Fail with a proper status code if search fails before sending anything
+    first_result = await anext(results)
+    if "next" in first_result:
+        await results.aclose()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No video matched that query - {q}!",
         )
-    return models.SearchVideosResponse(query=q, results=videos_found)
+
+    async def encode_results():
+        yield encode_search_result(first_result, format)
+        async for result in results:
+            yield encode_search_result(result, format)
+
+    return StreamingResponse(
+        encode_results(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+def encode_search_result(result: dict, format: t.Literal["ndjson", "sse"]) -> str:
+    if format == "sse":
+        ((event, data),) = result.items()
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps(result) + "\n"
 
 
 @router.get("/metadata", name="Video metadata")
 @router_exception_handler
 def get_video_metadata(
     url: str = Query(description="Video URL or ID"),
+    if_none_match: t.Annotated[
+        str, Header(description="ETag of a previously fetched metadata.")
+    ] = None,
 ) -> models.VideoMetadataResponse:
     """Get metadata of a specific video.
     - Similar subsequent requests will be faster as they will be served
     from the cache for a few hours.
+    - Responds with `304` when metadata matches the `If-None-Match` ETag.
     """
-    extracted_info = get_extracted_info(yt=yt, url=url)
-    video_formats = yt.get_video_qualities_with_extension(
-        extracted_info,
-        ext=loaded_config.default_extension,
-        audio_ext=loaded_config.default_audio_format,
+    summary, etag = get_video_summary(yt=yt, url=url)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in [tag.strip(" W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(summary, media_type="application/json", headers=headers)
+
+
+@router.post("/metadata/batch", name="Videos metadata")
+@router_exception_handler
+async def get_videos_metadata(
+    payload: models.VideoMetadataBatchPayload,
+) -> models.VideoMetadataBatchResponse:
+    """Get metadata of several videos at once.
+    - Cached summaries are looked up together and the rest extracted concurrently.
+    - Each video gets either its metadata or the error encountered.
+    """
+    video_ids: list[str | Exception] = []
+    for url in payload.urls:
+        try:
+            video_ids.append(get_video_id(url))
+        except Exception as e:
+            video_ids.append(e)
+    unique_video_ids = list(
+        dict.fromkeys(video_id for video_id in video_ids if isinstance(video_id, str))
     )
-    updated_video_formats = yt.update_audio_video_size(video_formats)
-    audio_formats = []
-    video_formats = []
-    for quality, format in updated_video_formats.items():
-        if quality in audioQualities:
-            audio_formats.append(
-                dict(
-                    quality=quality,
-                    size=get_size_string(format.audio_video_size),
-                )
+
+    summaries: dict[str, tuple[bytes, str] | Exception] = await run_in_threadpool(
+        get_cached_video_summaries, unique_video_ids
+    )
+
+    async def fetch(video_id: str):
+        try:
+            summaries[video_id] = await asyncio.wrap_future(
+                metadata_executor.submit(get_video_summary, yt, video_id)
             )
-        else:
-            video_formats.append(
-                dict(
-                    quality=quality,
-                    size=get_size_string(format.audio_video_size),
+        except Exception as e:
+            summaries[video_id] = e
+
+    await asyncio.gather(
+        *[fetch(video_id) for video_id in unique_video_ids if video_id not in summaries]
+    )
+
+    def summarize() -> list[dict]:
+        results = []
+        for url, video_id in zip(payload.urls, video_ids):
+            result = summaries[video_id] if isinstance(video_id, str) else video_id
+            if not isinstance(result, Exception):
+                try:
+                    summary, _ = result
+                    result = models.VideoMetadataResponse.model_validate_json(summary)
+                except Exception as e:
+                    result = e
+            if isinstance(result, Exception):
+                http_exception = _to_http_exception(result)
+                results.append(
+                    dict(
+                        url=url,
+                        error=dict(
+                            status_code=http_exception.status_code,
+                            detail=http_exception.detail,
+                        ),
+                    )
                 )
-            )
+            else:
+                results.append(dict(url=url, metadata=result))
+        return results
 
-    return models.VideoMetadataResponse(
-        id=extracted_info.id,
-        title=extracted_info.title,
-        channel=extracted_info.channel,
-        uploader_url=extracted_info.uploader_url,
-        duration_string=extracted_info.duration_string,
-        thumbnail=extracted_info.thumbnail,
-        audio=audio_formats or [{"quality": "bestaudio"}],
-        video=video_formats or [{"quality": "best"}],
-        format=dict(
-            audio=loaded_config.default_audio_format,
-            video="mp4",
-        ),
-        others=dict(
-            like_count=extracted_info.like_count,
-            views_count=extracted_info.view_count,
-            categories=extracted_info.categories or [],
-            tags=extracted_info.tags or [],
-        ),
+    # Parsing summaries of large batches is CPU bound
+    results = await run_in_threadpool(summarize)
+    return models.VideoMetadataBatchResponse(results=results)
+
+
+@router.get("/playlist", name="Playlist videos")
+@router_exception_handler
+def get_playlist_videos(
+    url: str = Query(description="Playlist URL or ID"),
+    warm_up: bool = Query(
+        False, description="Extract info of the videos in the background."
+    ),
+) -> models.PlaylistResponse:
+    """List videos in a playlist.
+    - Videos are listed without being extracted, up to a limit.
+    - With `warm_up`, their info is extracted in the background so that
+    subsequent metadata and download requests are faster.
+    """
+    return get_playlist_response(expand_playlist(get_playlist_url(url)), warm_up)
+
+
+@router.get("/channel", name="Channel videos")
+@router_exception_handler
+def get_channel_videos(
+    url: str = Query(description="Channel URL, handle or ID"),
+    warm_up: bool = Query(
+        False, description="Extract info of the videos in the background."
+    ),
+) -> models.PlaylistResponse:
+    """List videos uploaded by a channel, latest first.
+    - Videos are listed without being extracted, up to a limit.
+    - With `warm_up`, their info is extracted in the background so that
+    subsequent metadata and download requests are faster.
+    """
+    return get_playlist_response(expand_playlist(get_channel_url(url)), warm_up)
+
+
+def get_playlist_response(playlist: dict, warm_up: bool) -> models.PlaylistResponse:
+    warming_up = (
+        warm_up_extracted_infos([entry["id"] for entry in playlist["entries"]])
+        if warm_up
+        else 0
     )
+    return models.PlaylistResponse(**playlist, warming_up=warming_up)
+
+
+def warm_up_extracted_infos(video_ids: list[str]) -> int:
+    """Extract and cache info of the videos not yet cached in the background.
+
+    Returns:
+        int: Videos being extracted.
+    """
+    cached_extracted_infos = get_cached_extracted_infos(video_ids)
+    missing_ids = [
+        video_id
+        for video_id in dict.fromkeys(video_ids)
+        if video_id not in cached_extracted_infos
+    ]
+
+    def log_failure(future: Future):
+        if future.exception():
+            logger.error(f"Failed to warm up video info - {future.exception()}")
+
+    for video_id in missing_ids:
+        metadata_executor.submit(get_extracted_info, yt, video_id).add_done_callback(
+            log_failure
+        )
+    return len(missing_ids)
 
 
 @router.post("/download", name="Process download")
-def process_video_for_download(
+@router_exception_handler
+async def process_video_for_download(
     request: Request,
     payload: models.MediaDownloadProcessPayload,
     x_lang: t.Annotated[
@@ -178,195 +376,499 @@ def process_video_for_download(
     - To download the media file: Add parameter `download` with value
     `true` to the returned link i.e `?download=true`.
     - Accomplish the same using websocket endpoint at `/api/v1/download/ws`
+    - Use `/api/v1/jobs` to get a job id without waiting for the download.
     """
     payload.x_lang = x_lang or payload.x_lang
-    return real_download_process(request, payload)
+    job = download_jobs.submit(get_client_id(request), request, payload)
+    return await asyncio.wrap_future(job.future)
 
 
+@router.get("/download/stream", name="Stream download")
 @router_exception_handler
-def real_download_process(
-    request: t.Union[Request, WebSocket],
-    payload: models.MediaDownloadProcessPayload,
-    progress_hooks: list[t.Callable] = [],
-    **kwargs,
-) -> models.MediaDownloadResponse:
-    extracted_info = get_extracted_info(yt=yt, url=payload.url)
+async def stream_video_download(
+    url: str = Query(description="Video URL or ID"),
+    quality: mediaQualitiesType = Query(
+        description="Audio quality or video quality of a single-stream format"
+    ),
+    download: bool = Query(False, description="Serve the media as an attachment"),
+):
+    """Stream media to the client while it is being fetched
+    - Bytes are sent as soon as they arrive from youtube and the file is kept
+    for later requests.
+    - Supports audio qualities (in original format, no bitrate conversion) and
+    video qualities whose format carries audio. Use `/api/v1/download` for the rest.
+    """
+    payload = models.MediaDownloadProcessPayload(url=url, quality=quality, x_lang=None)
+    artifact_key = get_download_artifact_key(payload)
+    artifact = await run_in_threadpool(get_download_artifact, artifact_key)
+    if artifact:
+        return await serve_static_file(
+            download_dir.joinpath(artifact.filename), download=download
+        )
+
+    extracted_info = await run_in_threadpool(
+        get_downloadable_extracted_info, yt=yt, url=url
+    )
     video_formats = yt.get_video_qualities_with_extension(
         extracted_info,
         ext=loaded_config.default_extension,
-        audio_ext=(
-            loaded_config.default_audio_format
-            if payload.quality in audioQualities
-            else "webm"
-        ),
+        audio_ext=loaded_config.default_audio_format,
+    )
+    target_format = video_formats.get(quality)
+    assert target_format, f"The video does not support the quality '{quality}'."
+    assert (
+        target_format.url
+        and target_format.protocol in (None, "http", "https")
+        and target_format.acodec not in (None, "none")
+    ), (
+        f"The '{quality}' quality is made up of separate audio and video streams "
+        "and cannot be streamed. Use /api/v1/download instead."
     )
-    target_format = video_formats.get(payload.quality)
 
-    ytdl_opts = {
-        "outtmpl": (
-            f"{loaded_config.filename_prefix or ''}"
-            f"{sanitize_filename(extracted_info.title)} "
-            f"(%(format_note)s{', %(id)s' if loaded_config.append_id_in_filename else ''}).%(ext)s"
-        )
-    }
-
-    if loaded_config.embed_subtitles and payload.x_lang is not None:
-        ytdl_opts.update(
-            {
-                "postprocessors": [
-                    {"already_have_subtitle": False, "key": "FFmpegEmbedSubtitle"}
-                ],
-                "writeautomaticsub": True,
-                "writesubtitles": True,
-                "subtitleslangs": [payload.x_lang],
-            }
+    filename = get_output_template(extracted_info, payload) % dict(
+        format_note=target_format.format_note,
+        ext=target_format.ext,
+        id=extracted_info.id,
+    )
+    chunks = stream_media(
+        target_format.url,
+        target_format.http_headers,
+        save_to=download_dir.joinpath(filename),
+        on_complete=lambda filepath: save_download_artifact(artifact_key, filepath),
+    )
+    try:
+        first_chunk = await anext(chunks)
+    except StopAsyncIteration:
+        first_chunk = b""
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to stream {url} ({quality}) - {e}")
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Failed to fetch the media from youtube. Try again later.",
         )
 
-    kwargs["ytdl_params"] = ytdl_opts
+    async def body() -> t.AsyncIterator[bytes]:
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
 
-    if payload.quality in audioQualities:
-        assert target_format, (
-            f"The video does not support the audio quality '{payload.quality}'. "
-            f"Try other audio qualities like {', '.join([quality for quality in audioQualities if quality != payload.quality])}."
+    headers = {"X-Accel-Buffering": "no"}
+    if download:
+        headers["Content-Disposition"] = (
+            f"attachment; filename*=utf-8''{quote(filename)}"
         )
-        processed_info_dict = downloader.ydl_run_audio(
-            extracted_info,
-            audio_format=target_format.format_id,
-            bitrate=payload.bitrate,
-            progress_hooks=progress_hooks,
-            **kwargs,
-        )
-    elif payload.quality in videoQualities:
-        assert target_format, (
-            f"The video does not support the video quality '{payload.quality}'. "
-            f"Try other video qualities like {', '.join([quality for quality in videoQualities if quality != payload.quality])}."
-        )
-        processed_info_dict = downloader.ydl_run_video(
-            extracted_info,
-            video_format=target_format.format_id,
-            output_ext="mp4",
-            progress_hooks=progress_hooks,
-            **kwargs,
+    return StreamingResponse(
+        body(),
+        media_type=guess_type(filename)[0] or "application/octet-stream",
+        headers=headers,
+    )
+
+
+@router.post("/jobs", name="Queue download", status_code=status.HTTP_202_ACCEPTED)
+@router_exception_handler
+def queue_download_job(
+    request: Request,
+    payload: models.MediaDownloadProcessPayload,
+    x_lang: t.Annotated[
+        str,
+        Header(description="Two-letter ISO set language code for subtitle purposes."),
+    ] = None,
+) -> models.DownloadJobResponse:
+    """Queue a download and return its job immediately
+    - Poll `/api/v1/jobs/{id}` or subscribe to `/api/v1/jobs/{id}/ws` for its progress.
+    - Responds with `429` when the server or the client has too many queued downloads
+    and `503` once the server is shutting down.
+    """
+    payload.x_lang = x_lang or payload.x_lang
+    job = download_jobs.submit(get_client_id(request), request, payload)
+    return job.to_response()
+
+
+@router.post(
+    "/jobs/playlist",
+    name="Queue playlist download",
+    status_code=status.HTTP_202_ACCEPTED,
+)
+@router_exception_handler
+def queue_playlist_download_job(
+    request: Request,
+    payload: models.PlaylistDownloadProcessPayload,
+    x_lang: t.Annotated[
+        str,
+        Header(description="Two-letter ISO set language code for subtitle purposes."),
+    ] = None,
+) -> models.DownloadJobResponse:
+    """Queue download of every video in a playlist into a single zip file
+    - Videos are fetched concurrently and reused if previously downloaded.
+    - Poll `/api/v1/jobs/{id}` or subscribe to `/api/v1/jobs/{id}/ws` for its progress.
+    - Responds with `429` when the server or the client has too many queued downloads.
+    """
+    payload.x_lang = x_lang or payload.x_lang
+    get_playlist_url(payload.url)
+    job = download_jobs.submit(
+        get_client_id(request), request, payload, real_playlist_download_process
+    )
+    return job.to_response()
+
+
+@router.get("/jobs/{job_id}", name="Download job status")
+def get_download_job(job_id: str) -> models.DownloadJobResponse:
+    """Get status of a download job
+    - `result` is set once the job is `done` and `error` if it `failed`.
+    """
+    job = download_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"There is no download job with id - {job_id}",
         )
-        # TODO: Consider audio_format as well
-    else:
-        # bestaudio | bestvideo | best
-        if payload.bitrate:
-            # audio
-            processed_info_dict = downloader.ydl_run_audio(
-                extracted_info,
-                payload.bitrate,
-                audio_format=payload.quality,
-            )
-        else:
-            processed_info_dict = downloader.ydl_run(
-                extracted_info,
-                video_format=None,
-                audio_format=None,
-                default_format=payload.quality,
-            )
+    return job.to_response()
 
-    filepath = Path(processed_info_dict["requested_downloads"][0]["filepath"])
+
+@router_exception_handler
+def real_download_process(
+    request: t.Union[Request, WebSocket],
+    payload: models.MediaDownloadProcessPayload,
+    progress_hooks: list[t.Callable] = [],
+    **kwargs,
+) -> models.MediaDownloadResponse:
+    artifact = fetch_download_artifact(payload, progress_hooks, **kwargs)
+    filepath = download_dir.joinpath(artifact.filename)
+    storage.record_access(artifact.filename)
 
     return models.MediaDownloadResponse(
         is_success=True,
         filename=filepath.name,
-        filesize=get_size_string(path.getsize(filepath)),
+        filesize=get_size_string(artifact.filesize),
         link=get_absolute_link_to_static_file(filepath.name, request),
     )
 
 
-@router.websocket("/download/ws", name="Process download (websocket)")
-async def download_websocket_handler(websocket: WebSocket):
-    await websocket.accept()
+def fetch_download_artifact(
+    payload: models.MediaDownloadProcessPayload,
+    progress_hooks: list[t.Callable] = [],
+    **kwargs,
+) -> DownloadArtifact:
+    """Get the file a download request produces, downloading it if need be"""
+    artifact_key = get_download_artifact_key(payload)
+    return get_download_artifact(artifact_key) or download_once(
+        artifact_key,
+        progress_hooks,
+        produce_download_artifact,
+        artifact_key,
+        payload,
+        **kwargs,
+    )
 
-    try:
 
-        async def send_progress(response: CustomWebsocketResponse):
-            await websocket.send_json(response.model_dump())
+@router_exception_handler
+def real_playlist_download_process(
+    request: t.Union[Request, WebSocket],
+    payload: models.PlaylistDownloadProcessPayload,
+    progress_hooks: list[t.Callable] = [],
+    **kwargs,
+) -> models.MediaDownloadResponse:
+    playlist = expand_playlist(get_playlist_url(payload.url))
+    if not playlist["entries"]:
+        raise UserInputError(f"Playlist has no downloadable videos - {payload.url}")
+    entry_payloads = [
+        models.MediaDownloadProcessPayload(
+            url=entry["id"],
+            quality=payload.quality,
+            bitrate=payload.bitrate,
+            x_lang=payload.x_lang,
+        )
+        for entry in playlist["entries"]
+    ]
+    entries_hash = sha1(
+        ",".join(entry["id"] for entry in playlist["entries"]).encode()
+    ).hexdigest()[:12]
+    artifact_key = ":".join(
+        [
+            playlist["id"],
+            *get_download_artifact_key(entry_payloads[0]).split(":")[1:],
+            entries_hash,
+        ]
+    )
+    artifact = get_download_artifact(artifact_key) or download_once(
+        artifact_key,
+        progress_hooks,
+        produce_playlist_archive,
+        artifact_key,
+        playlist,
+        entry_payloads,
+    )
+    storage.record_access(artifact.filename)
 
-        @silence_websocket_exceptions
-        async def close_websocket():
-            if websocket.state == WebSocketState.CONNECTED:
-                await websocket.close()
+    return models.MediaDownloadResponse(
+        is_success=True,
+        filename=artifact.filename,
+        filesize=get_size_string(artifact.filesize),
+        link=get_absolute_link_to_static_file(artifact.filename, request),
+    )
 
-        payload_dict: dict = await websocket.receive_json()
-        request_payload = models.MediaDownloadProcessPayload(**payload_dict)
 
-        def progress_hook(d: dict):
-            if d["status"] == "downloading":
+def produce_playlist_archive(
+    artifact_key: str,
+    playlist: dict,
+    entry_payloads: list[models.MediaDownloadProcessPayload],
+    progress_hooks: list[t.Callable] = [],
+) -> DownloadArtifact:
+    """Download videos of a playlist concurrently and archive them into a zip
+    file as each completes. Videos already downloaded are reused."""
+    artifact = get_download_artifact(artifact_key)
+    if artifact:
+        return artifact
+
+    # Key variants set apart archives of the same playlist
+    _, quality, bitrate, x_lang, entries_hash = artifact_key.split(":")
+    variants = ", ".join(
+        variant for variant in (quality, bitrate, x_lang) if variant != "-"
+    )
+    filepath = download_dir.joinpath(
+        sanitize_filename(
+            f"{playlist['title'] or playlist['id']} ({variants}) {entries_hash}.zip"
+        )
+    )
+    part_path = filepath.with_name(f"{filepath.name}.{uuid4().hex}.part")
+    errors: list[Exception] = []
+    try:
+        with ThreadPoolExecutor(
+            max_workers=loaded_config.playlist_download_workers,
+            thread_name_prefix="playlist-download",
+        ) as executor, ZipFile(part_path, "w", compression=ZIP_STORED) as archive:
+            futures = {
+                executor.submit(fetch_download_artifact, entry_payload): index
+                for index, entry_payload in enumerate(entry_payloads, start=1)
+            }
+            for future in as_completed(futures):
                 try:
-                    progress = (
-                        d.get("downloaded_bytes", 0) / d.get("total_bytes", 1) * 100
-                    )
-                except Exception:
-                    return
-
-                speed = d.get("speed") or 0
-                eta = d.get("eta") or 0
-
-                if not speed:
-                    return
-
-                progress_data = {
-                    "progress": f"{progress:.1f}%",
-                    "speed": f"{speed/1024/1024:.1f} MB/s",
-                    "eta": f"{eta//60}:{eta%60:02d}",
-                    "ext": d.get("filename", "").split(".")[-1],
-                }
-                asyncio.run(
-                    send_progress(
-                        CustomWebsocketResponse(
-                            status="downloading", detail=progress_data
-                        )
+                    entry_artifact: DownloadArtifact = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to download playlist entry - {e}")
+                    errors.append(e)
+                    continue
+                arcname = f"{futures[future]:03d} - {entry_artifact.filename}"
+                with storage.serving(entry_artifact.filename):
+                    archive.write(
+                        download_dir.joinpath(entry_artifact.filename), arcname
                     )
-                )
+                for hook in progress_hooks:
+                    hook(dict(status="finished", filename=arcname))
 
-            elif d["status"] == "finished":
-                filename = d.get("filename", "").split("/")[-1]
-                asyncio.run(
-                    send_progress(
-                        CustomWebsocketResponse(
-                            status="finished", detail=dict(filename=filename)
-                        )
-                    )
-                )
+        if len(errors) == len(entry_payloads):
+            raise errors[0]
+        os.replace(part_path, filepath)
+    finally:
+        part_path.unlink(missing_ok=True)
 
-        @silence_websocket_exceptions
-        def initiate_download() -> models.MediaDownloadResponse:
-            try:
-                return real_download_process(
-                    request=websocket,
-                    payload=request_payload,
-                    progress_hooks=[progress_hook],
-                )
-            except HTTPException as e:
-                asyncio.run(
-                    send_progress(
-                        CustomWebsocketResponse(
-                            status="error",
-                            detail=dict(status_code=e.status_code, text=e.detail),
-                        )
-                    )
-                )
+    return save_download_artifact(artifact_key, filepath)
+
+
+def produce_download_artifact(
+    artifact_key: str,
+    payload: models.MediaDownloadProcessPayload,
+    progress_hooks: list[t.Callable] = [],
+    **kwargs,
+) -> DownloadArtifact:
+    """Download media and index the produced file"""
+    artifact = get_download_artifact(artifact_key)
+    if artifact:
+        # Identical download completed while this one was being scheduled
+        return artifact
+    extracted_info = get_downloadable_extracted_info(yt=yt, url=payload.url)
+    filepath = run_download(extracted_info, payload, progress_hooks, **kwargs)
+    return save_download_artifact(artifact_key, filepath)
+
+
+download_jobs = DownloadJobQueue(
+    handler=real_download_process,
+    workers=loaded_config.download_workers,
+    max_queued=loaded_config.download_queue_size,
+    max_queued_per_client=loaded_config.download_queue_size_per_client,
+    retention_in_secs=loaded_config.download_job_retention_in_secs,
+)
+
+
+class WebsocketProgressRelay:
+    """Delivers yt-dlp progress events from download threads to a websocket.
+
+    Events are queued into the event loop owning the websocket and sent from
+    there. `downloading` updates are throttled to at most one per
+    `websocket_progress_interval_in_secs` and only when progress changed by
+    `websocket_progress_min_change` percent. Streams of merged formats fetched
+    concurrently are throttled separately and their updates name the `stream`.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue[dict | None] = asyncio.Queue()
+        self.is_closed = False
+        self._last_sent_on: dict[str | None, float] = {}
+        self._last_progress: dict[str | None, float] = {}
+
+    def hook(self, d: dict):
+        """yt-dlp progress hook. Safe to call from any thread."""
+        if self.is_closed:
+            return
+        stream = d.get("stream")
+        if d["status"] == "downloading":
+            downloaded_bytes = d.get("downloaded_bytes") or 0
+            total_bytes = d.get("total_bytes") or d.get("total_bytes_estimate")
+            speed = d.get("speed") or 0
+            if not total_bytes or not speed:
+                return
+
+            progress = downloaded_bytes / total_bytes * 100
+            now = time.monotonic()
+            if progress < 100 and (
+                now - self._last_sent_on.get(stream, 0.0)
+                < loaded_config.websocket_progress_interval_in_secs
+                or abs(progress - self._last_progress.get(stream, -100.0))
+                < loaded_config.websocket_progress_min_change
+            ):
+                return
+            self._last_sent_on[stream] = now
+            self._last_progress[stream] = progress
+
+            eta = int(d.get("eta") or 0)
+            detail = {
+                "progress": f"{progress:.1f}%",
+                "speed": f"{speed/1024/1024:.1f} MB/s",
+                "eta": f"{eta//60}:{eta%60:02d}",
+                "ext": d.get("filename", "").split(".")[-1],
+            }
+            if stream:
+                detail["stream"] = stream
+            response = CustomWebsocketResponse(status="downloading", detail=detail)
+
+        elif d["status"] == "finished":
+            filename = d.get("filename", "").split("/")[-1]
+            detail = dict(filename=filename)
+            if stream:
+                detail["stream"] = stream
+            response = CustomWebsocketResponse(status="finished", detail=detail)
+            # Next file's progress starts afresh
+            self._last_progress.pop(stream, None)
 
-        download_report = await asyncio.get_running_loop().run_in_executor(
-            None, initiate_download
-        )
-        if isinstance(download_report, models.MediaDownloadResponse):
-            await send_progress(
-                CustomWebsocketResponse(
-                    status="completed", detail=download_report.model_dump()
-                )
-            )
         else:
-            await close_websocket()
+            return
+
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, response.model_dump())
+
+    async def run(self):
+        """Send queued events until `close` is called"""
+        while True:
+            message = await self.queue.get()
+            if message is None:
+                return
+            try:
+                await self.websocket.send_json(message)
+            except Exception as e:
+                logger.error(f"Websocket progress error {e}")
+                self.is_closed = True
+                return
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+
+async def relay_download_job(websocket: WebSocket, job: DownloadJob):
+    """Report progress and outcome of a download job to a websocket client"""
+    if job.status in ("queued", "running"):
+        await websocket.send_json(
+            CustomWebsocketResponse(
+                status=job.status, detail=dict(id=job.id)
+            ).model_dump()
+        )
+    relay = WebsocketProgressRelay(websocket)
+    sender = asyncio.create_task(relay.run())
+    progress_hooks = [relay.hook]
+    job.progress.attach(progress_hooks)
+    try:
+        download_report = await asyncio.wrap_future(job.future)
+    except HTTPException as e:
+        response = CustomWebsocketResponse(
+            status="error", detail=dict(status_code=e.status_code, text=e.detail)
+        )
+    except Exception as e:
+        http_exception = _to_http_exception(e)
+        response = CustomWebsocketResponse(
+            status="error",
+            detail=dict(
+                status_code=http_exception.status_code, text=http_exception.detail
+            ),
+        )
+    else:
+        response = CustomWebsocketResponse(
+            status="completed", detail=download_report.model_dump()
+        )
+    finally:
+        job.progress.detach(progress_hooks)
+        relay.close()
+        await sender
+    await websocket.send_json(response.model_dump())
+
+
+@router.websocket("/download/ws", name="Process download (websocket)")
+async def download_websocket_handler(websocket: WebSocket):
+    await websocket.accept()
+
+    @silence_websocket_exceptions
+    async def close_websocket():
+        if websocket.state == WebSocketState.CONNECTED:
+            await websocket.close()
+
+    try:
+        payload_dict: dict = await websocket.receive_json()
+        request_payload = models.MediaDownloadProcessPayload(**payload_dict)
+        job = download_jobs.submit(get_client_id(websocket), websocket, request_payload)
+        await relay_download_job(websocket, job)
+        await close_websocket()
 
     except ValidationError as e:
         error = CustomWebsocketResponse(
             status="error", detail=dict(errors=json.loads(e.json()))
         )
-        await send_progress(error)
+        await websocket.send_json(error.model_dump())
+        await close_websocket()
+
+    except DownloadQueueFull as e:
+        error = CustomWebsocketResponse(
+            status="error",
+            detail=dict(status_code=status.HTTP_429_TOO_MANY_REQUESTS, text=str(e)),
+        )
+        await websocket.send_json(error.model_dump())
+        await close_websocket()
+
+    except Exception as e:
+        logger.error(f"Websocket error {e}")
+        await close_websocket()
+
+
+@router.websocket("/jobs/{job_id}/ws", name="Download job progress (websocket)")
+async def download_job_websocket_handler(websocket: WebSocket, job_id: str):
+    await websocket.accept()
+
+    @silence_websocket_exceptions
+    async def close_websocket():
+        if websocket.state == WebSocketState.CONNECTED:
+            await websocket.close()
+
+    try:
+        job = download_jobs.get(job_id)
+        if job is None:
+            error = CustomWebsocketResponse(
+                status="error",
+                detail=dict(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    text=f"There is no download job with id - {job_id}",
+                ),
+            )
+            await websocket.send_json(error.model_dump())
+        else:
+            await relay_download_job(websocket, job)
         await close_websocket()
 
     except Exception as e:
@@ -0,0 +1,205 @@
+"""Asynchronous video search on youtube's InnerTube API"""
+
+import dataclasses
+import typing as t
+import httpx
+from innertube import api, utils
+from innertube.config import config
+from innertube.enums import Endpoint
+from innertube.errors import RequestError, ResponseError
+from innertube.models import ClientContext
+from app.config import loaded_config
+
+PARAMS_TYPE_VIDEO = "EgIQAQ%3D%3D"
+
+max_search_pages = 5
+"""Pages to fetch at most for a single search"""
+
+
+class AsyncInnerTube:
+    """Asynchronous counterpart of `innertube.InnerTube`.
+
+    Requests are made over a pooled keep-alive client so that concurrent
+    searches share connections instead of occupying a thread each.
+    """
+
+    def __init__(
+        self,
+        client_name: str,
+        client_version: t.Optional[str] = None,
+        **client_kwargs,
+    ):
+        """`AsyncInnerTube` Constructor
+
+        Args:
+            client_name (str): InnerTube client to impersonate e.g WEB.
+            client_version (t.Optional[str], optional): Client version. Defaults to
+                the one known to `innertube`.
+            client_kwargs: Passed to `httpx.AsyncClient`.
+        """
+        context = api.get_context(client_name)
+        if context is None:
+            raise ValueError(f"Unknown innertube client - {client_name}")
+        self.context: ClientContext = dataclasses.replace(
+            context, **utils.filter(dict(client_version=client_version))
+        )
+        self.client = httpx.AsyncClient(base_url=config.base_url, **client_kwargs)
+
+    async def __call__(self, endpoint: str, body: t.Optional[dict] = None) -> dict:
+        response = await self.client.post(
+            endpoint,
+            params=self.context.params(),
+            json=api.contextualise(self.context, body or {}),
+            headers=self.context.headers(),
+        )
+        content_type = response.headers.get("Content-Type")
+        if content_type and not content_type.lower().startswith("application/json"):
+            raise ResponseError(f"Expected JSON response, got {content_type!r}")
+
+        response_data: dict = response.json()
+        visitor_data = response_data.get("responseContext", {}).get("visitorData")
+        if visitor_data is not None:
+            self.client.headers["X-Goog-Visitor-Id"] = visitor_data
+
+        error = response_data.get("error")
+        if error is not None:
+            raise RequestError(api.error(error))
+
+        response_data.pop("responseContext", None)
+        return response_data
+
+    async def search(
+        self,
+        query: t.Optional[str] = None,
+        *,
+        params: t.Optional[str] = None,
+        continuation: t.Optional[str] = None,
+    ) -> dict:
+        return await self(
+            Endpoint.SEARCH,
+            body=utils.filter(
+                dict(query=query or "", params=params, continuation=continuation)
+            ),
+        )
+
+    async def aclose(self) -> t.NoReturn:
+        await self.client.aclose()
+
+
+innertube_client = AsyncInnerTube(
+    "WEB",
+    "2.20230920.00.00",
+    proxies=loaded_config.proxy or None,
+    timeout=httpx.Timeout(
+        loaded_config.search_read_timeout_in_secs,
+        connect=loaded_config.search_connect_timeout_in_secs,
+    ),
+    limits=httpx.Limits(
+        max_connections=loaded_config.search_max_connections,
+        max_keepalive_connections=loaded_config.search_max_connections,
+    ),
+)
+
+
+def parse_search_page(response: dict) -> tuple[list[dict[str, str]], str | None]:
+    """Extract videos and continuation token from a page of search results.
+
+    Args:
+        response (dict): Response to a search or continuation request.
+
+    Returns:
+        tuple[list[dict[str, str]], str | None]: Sorted shallow results and the
+            continuation token of the next page if any.
+    """
+    if "contents" in response:
+        sections = response["contents"]["twoColumnSearchResultsRenderer"][
+            "primaryContents"
+        ]["sectionListRenderer"]["contents"]
+    else:
+        sections = []
+        for command in response.get("onResponseReceivedCommands", []):
+            sections.extend(
+                command.get("appendContinuationItemsAction", {}).get(
+                    "continuationItems", []
+                )
+            )
+
+    video_metadata_container: list[dict] = []
+    continuation = None
+    for section in sections:
+        if "continuationItemRenderer" in section:
+            continuation = section["continuationItemRenderer"]["continuationEndpoint"][
+                "continuationCommand"
+            ]["token"]
+            continue
+
+        for content in section.get("itemSectionRenderer", {}).get("contents", []):
+            try:
+                video = content["videoRenderer"]
+                video_id = video["videoId"]
+                video_title = video["title"]["runs"][0]["text"]
+                video_duration = video["lengthText"]["simpleText"]
+                video_metadata_container.append(
+                    dict(id=video_id, title=video_title, duration=video_duration)
+                )
+
+            except Exception:  # KeyError etc
+                pass
+    return video_metadata_container, continuation
+
+
+async def search_video_pages(
+    query: str, continuation: str | None = None
+) -> t.AsyncIterator[tuple[list[dict[str, str]], str | None]]:
+    """Yield pages of videos matching query as they are fetched.
+
+    Args:
+        query (str): Search keyword
+        continuation (str | None, optional): Token of the page to start at.
+            Defaults to the first page.
+    """
+    for _ in range(max_search_pages):
+        if continuation:
+            response = await innertube_client.search(continuation=continuation)
+        else:
+            response = await innertube_client.search(query, params=PARAMS_TYPE_VIDEO)
+        videos, continuation = parse_search_page(response)
+        yield videos, continuation
+        if not continuation:
+            break
+
+
+async def search_videos_by_key(
+    query: str,
+    continuation: str | None = None,
+    limit: int = None,
+    on_page: t.Callable[[list[dict[str, str]]], t.Any] = None,
+) -> tuple[list[dict[str, str]], str | None]:
+    """Perform a video search on youtube.
+
+    Pages are fetched until `limit` videos are found or there are no more.
+    The rest are left to the returned continuation token.
+
+    Args:
+        query (str): Search keyword
+        continuation (str | None, optional): Token of the page to start at.
+            Defaults to the first page.
+        limit (int, optional): Videos needed. Defaults to `search_limit`.
+        on_page (t.Callable, optional): Called with the new videos of each page
+            as soon as it is parsed.
+
+    Returns:
+        tuple[list[dict[str, str]], str | None]: Sorted shallow results and the
+            continuation token of the results that follow.
+    """
+    video_metadata_container: list[dict] = []
+    video_ids = set()
+    async for videos, continuation in search_video_pages(query, continuation):
+        new_videos = [video for video in videos if video["id"] not in video_ids]
+        video_ids.update(video["id"] for video in new_videos)
+        video_metadata_container.extend(new_videos)
+        if on_page:
+            on_page(new_videos)
+        if len(video_metadata_container) >= (limit or loaded_config.search_limit):
+            break
+    return video_metadata_container, continuation
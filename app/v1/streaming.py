@@ -0,0 +1,80 @@
+"""Streaming of media to clients while it is being fetched from youtube"""
+
+import os
+import typing as t
+import anyio
+import httpx
+from pathlib import Path
+from uuid import uuid4
+from app.config import loaded_config
+from app.utils import logger
+
+media_client = httpx.AsyncClient(
+    proxies=loaded_config.proxy or None,
+    timeout=httpx.Timeout(30),
+    follow_redirects=True,
+)
+"""Pooled client for fetching media streams"""
+
+
+async def stream_media(
+    url: str,
+    http_headers: dict[str, str],
+    save_to: Path,
+    on_complete: t.Callable[[Path], t.Any],
+) -> t.AsyncIterator[bytes]:
+    """Yield media chunks as they arrive while persisting them to `save_to`.
+
+    The media is fetched in `stream_chunk_size` ranges as yt-dlp does to avoid
+    throttling. The file only takes its final name once fully fetched, after
+    which `on_complete` is called with its path in a worker thread.
+    Partially fetched files are deleted. Fetch errors are raised, aborting the
+    response if it has already started.
+
+    Args:
+        url (str): Media stream url.
+        http_headers (dict[str, str]): Headers for requesting the url.
+        save_to (Path): Path to save the media to.
+        on_complete (t.Callable[[Path], t.Any]): Called once the file is saved.
+    """
+    part_path = save_to.with_name(f"{save_to.name}.{uuid4().hex}.part")
+    is_complete = False
+    start = 0
+    try:
+        async with await anyio.open_file(part_path, "wb") as fh:
+            while True:
+                end = start + loaded_config.stream_chunk_size - 1
+                async with media_client.stream(
+                    "GET",
+                    url,
+                    headers={**http_headers, "Range": f"bytes={start}-{end}"},
+                ) as response:
+                    response.raise_for_status()
+                    content_range = response.headers.get("content-range", "")
+                    total_bytes = (
+                        int(content_range.split("/")[-1])
+                        if response.status_code == 206
+                        and content_range.split("/")[-1].isdigit()
+                        else None
+                    )
+                    async for chunk in response.aiter_bytes():
+                        await fh.write(chunk)
+                        start += len(chunk)
+                        yield chunk
+                if total_bytes is None or start >= total_bytes:
+                    break
+
+        await anyio.to_thread.run_sync(os.replace, part_path, save_to)
+        is_complete = True
+        await anyio.to_thread.run_sync(on_complete, save_to)
+
+    except httpx.HTTPError as e:
+        if start:
+            # Headers are already sent. Aborting the connection is all that
+            # tells the client the file is incomplete.
+            logger.error(f"Media streaming failed for {save_to.name} - {e}")
+        raise
+
+    finally:
+        if not is_complete:
+            part_path.unlink(missing_ok=True)
@@ -2,52 +2,713 @@
 
 from yt_dlp_bonus import YoutubeDLBonus
 from yt_dlp_bonus.models import ExtractedInfo
-from app.utils import get_video_id, utc_now
-from app.db import VideoInfo, engine
+from yt_dlp_bonus.constants import videoQualities, audioQualities
+from yt_dlp_bonus.utils import get_size_string
+from app.utils import get_video_id, utc_now, logger
+from app.exceptions import InvalidSearchCursor
+from app.db import (
+    VideoInfo,
+    DownloadArtifact,
+    SearchResult,
+    engine,
+    async_engine,
+    has_usable_streams,
+    get_async_session,
+    video_info_cache_period,
+    search_results_cache_period,
+)
+from app.cache import TTLCache, SingleFlight, AsyncSingleFlight
+from app.storage import storage
+from app.config import loaded_config, download_dir
+from app.v1.models import MediaDownloadProcessPayload, VideoMetadataResponse
 from sqlmodel import select, Session
 from sqlalchemy.exc import IntegrityError
+from pathlib import Path
+from threading import Lock
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps, loads
+from hashlib import sha1
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+import typing as t
+import anyio
 
+extracted_info_cache = TTLCache(
+    "extracted_info",
+    maxsize=loaded_config.video_info_memory_cache_size,
+    ttl=loaded_config.video_info_memory_cache_ttl_in_secs,
+)
+"""In-memory tier of the VideoInfo cache. Holds validated `ExtractedInfo` objects
+keyed by video id. The objects are shared across requests."""
 
-def get_extracted_info(yt: YoutubeDLBonus, url: str) -> ExtractedInfo:
-    """Get url's extracted_info from cache or youtube accordingly"""
-    video_id = get_video_id(url)
+extraction_flight = SingleFlight()
+"""Concurrent lookups of a video share one database query and extraction"""
+
+video_summary_cache = TTLCache(
+    "video_summary",
+    maxsize=loaded_config.video_info_memory_cache_size,
+    ttl=loaded_config.video_info_memory_cache_ttl_in_secs,
+)
+"""Serialized metadata responses and their ETags keyed by video id"""
+
+video_info_refresh_flight = SingleFlight()
+"""Background refreshes of video infos in progress keyed by video id"""
+
+video_info_refresh_executor = ThreadPoolExecutor(
+    max_workers=loaded_config.video_info_refresh_workers,
+    thread_name_prefix="video-info-refresh",
+)
+
+video_info_accesses: Counter[str] = Counter()
+"""Lookups of video infos since the hot ones were last checked for refresh"""
+
+video_info_accesses_lock = Lock()
+
+search_results_cache = TTLCache(
+    "search_results",
+    maxsize=loaded_config.search_memory_cache_size,
+    ttl=search_results_cache_period.total_seconds(),
+)
+"""In-memory tier of the SearchResult cache keyed by normalized query"""
+
+search_flight = AsyncSingleFlight()
+"""Concurrent searches of a query share one database query and search"""
+
+
+def extract_info_from_youtube(yt: YoutubeDLBonus, url: str) -> ExtractedInfo:
+    """Extract url's info from youtube and model it"""
     raw_info = yt.extract_info(url, download=False)
-    
+
     data = raw_info.copy()
-    
-    channel_val = data.get("channel") or data.get("uploader") or data.get("creator") or "Unknown"
-    uploader_val = data.get("uploader") or data.get("channel") or data.get("creator") or "Unknown"
+
+    channel_val = (
+        data.get("channel") or data.get("uploader") or data.get("creator") or "Unknown"
+    )
+    uploader_val = (
+        data.get("uploader") or data.get("channel") or data.get("creator") or "Unknown"
+    )
     follower_count = data.get("channel_follower_count") or 0
-    
+
     data["channel"] = channel_val
     data["uploader"] = uploader_val
     data["channel_follower_count"] = follower_count
-    
-    extracted_info = ExtractedInfo(**data)
-    
+
+    return ExtractedInfo(**data)
+
+
+def get_extracted_info(yt: YoutubeDLBonus, url: str) -> ExtractedInfo:
+    """Get url's extracted_info from cache or youtube accordingly.
+
+    Lookup order is memory, database then youtube. Youtube is only reached
+    on a miss or when the cached info has expired past its grace period, and
+    only once for concurrent lookups of the same video. Within the grace
+    period the expired info is served while it's refreshed in the background.
+    """
+    video_id = get_video_id(url)
+    record_video_info_access(video_id)
+    extracted_info = extracted_info_cache.get(video_id)
+    if extracted_info is not None:
+        return extracted_info
+
+    return extraction_flight.do(video_id, load_extracted_info, yt, url, video_id)
+
+
+def get_downloadable_extracted_info(yt: YoutubeDLBonus, url: str) -> ExtractedInfo:
+    """Get url's extracted_info whose stream urls can still be downloaded from.
+
+    Cached info is reused as long as its stream urls do not expire within
+    `stream_url_expiry_margin_in_secs`, otherwise the video is re-extracted
+    even if its metadata is still valid.
+    """
+    extracted_info = get_extracted_info(yt, url)
+    if has_usable_streams(extracted_info):
+        return extracted_info
+
+    video_id = get_video_id(url)
+    return extraction_flight.do(
+        ("streams", video_id), load_downloadable_extracted_info, yt, url, video_id
+    )
+
+
+def load_downloadable_extracted_info(
+    yt: YoutubeDLBonus, url: str, video_id: str
+) -> ExtractedInfo:
+    """Load video's extracted_info with usable stream urls from database
+    or youtube"""
+    with Session(bind=engine) as session:
+        video_info = session.get(VideoInfo, video_id)
+        if video_info and video_info.is_valid and video_info.has_usable_streams:
+            # Refreshed by another worker
+            extracted_info = video_info.extracted_info
+            extracted_info_cache.set(
+                video_id, extracted_info, ttl=video_info.remaining_validity
+            )
+            return extracted_info
+
+    future, _, is_leader = video_info_refresh_flight.join(video_id)
+    if is_leader:
+        return video_info_refresh_flight.run(
+            video_id, future, refresh_extracted_info, yt, url, video_id
+        )
+    # Background refresh in progress
+    future.result()
+    extracted_info = extracted_info_cache.get(video_id)
+    if extracted_info is not None and has_usable_streams(extracted_info):
+        return extracted_info
+    return refresh_extracted_info(yt, url, video_id)
+
+
+def get_video_summary_format() -> str:
+    """Identifies the settings video summaries depend on"""
+    return f"{loaded_config.default_extension}:{loaded_config.default_audio_format}"
+
+
+def summarize_extracted_info(
+    yt: YoutubeDLBonus, extracted_info: ExtractedInfo
+) -> bytes:
+    """Serialized metadata response of a video"""
+    return get_video_metadata_response(yt, extracted_info).model_dump_json().encode()
+
+
+def set_video_summary(
+    video_info: VideoInfo, yt: YoutubeDLBonus, extracted_info: ExtractedInfo
+) -> bytes:
+    """Precompute and attach the metadata response of a video to its cache entry"""
+    video_info.summary = summarize_extracted_info(yt, extracted_info)
+    video_info.summary_format = get_video_summary_format()
+    return video_info.summary
+
+
+def get_video_summary(yt: YoutubeDLBonus, url: str) -> tuple[bytes, str]:
+    """Get serialized metadata response of a video from cache or youtube accordingly.
+
+    Cached summaries are served without parsing the video's extracted_info.
+
+    Returns:
+        tuple[bytes, str]: Serialized `VideoMetadataResponse` and its ETag.
+    """
+    video_id = get_video_id(url)
+    record_video_info_access(video_id)
+    summary = video_summary_cache.get(video_id)
+    if summary is not None:
+        return summary
+
+    return extraction_flight.do(
+        ("summary", video_id), load_video_summary, yt, url, video_id
+    )
+
+
+def load_video_summary(
+    yt: YoutubeDLBonus, url: str, video_id: str
+) -> tuple[bytes, str]:
+    """Load video's summary from database, computing it if need be, and cache
+    it in memory"""
+    with Session(bind=engine) as session:
+        video_info = session.get(VideoInfo, video_id)
+        if (
+            video_info
+            and video_info.is_within_grace
+            and video_info.summary_format == get_video_summary_format()
+        ):
+            # Served without caching in memory until it's refreshed
+            schedule_video_info_refresh(yt, url, video_id)
+        elif not (
+            video_info
+            and video_info.is_valid
+            and video_info.summary
+            and video_info.summary_format == get_video_summary_format()
+        ):
+            extracted_info = get_extracted_info(yt, url)
+            session.expire_all()
+            video_info = session.get(VideoInfo, video_id)
+            if video_info is None:
+                # Cache entry expired and got deleted meanwhile. The info may
+                # have been served from memory, so its age is unknown and the
+                # summary is neither persisted nor cached.
+                summary = summarize_extracted_info(yt, extracted_info)
+                return summary, f'"{sha1(summary).hexdigest()}"'
+            if video_info.summary_format != get_video_summary_format():
+                set_video_summary(video_info, yt, extracted_info)
+                session.add(video_info)
+                try:
+                    session.commit()
+                except IntegrityError:
+                    # Concurrent request cached it first
+                    session.rollback()
+                    video_info = session.get(VideoInfo, video_id)
+
+        summary = (video_info.summary, f'"{sha1(video_info.summary).hexdigest()}"')
+        video_summary_cache.set(video_id, summary, ttl=video_info.remaining_validity)
+        return summary
+
+
+def get_cached_video_summaries(video_ids: list[str]) -> dict[str, tuple[bytes, str]]:
+    """Get serialized metadata responses of many videos from memory and
+    database cache.
+
+    Videos missing in memory are looked up in a single query that leaves out
+    their extracted_info. Ones not cached, whose info has expired or whose
+    summary is outdated are left out.
+
+    Returns:
+        dict[str, tuple[bytes, str]]: Serialized `VideoMetadataResponse` and
+            its ETag keyed by video id.
+    """
+    summaries: dict[str, tuple[bytes, str]] = {}
+    for video_id in video_ids:
+        summary = video_summary_cache.get(video_id)
+        if summary is not None:
+            summaries[video_id] = summary
+
+    missing_ids = [video_id for video_id in video_ids if video_id not in summaries]
+    if not missing_ids:
+        return summaries
+
+    now = utc_now()
+    query = select(VideoInfo.id, VideoInfo.summary, VideoInfo.updated_on).where(
+        VideoInfo.id.in_(missing_ids),
+        VideoInfo.updated_on >= now - video_info_cache_period,
+        VideoInfo.summary.is_not(None),
+        VideoInfo.summary_format == get_video_summary_format(),
+    )
+    with Session(bind=engine) as session:
+        for video_id, summary, updated_on in session.exec(query):
+            summaries[video_id] = (summary, f'"{sha1(summary).hexdigest()}"')
+            video_summary_cache.set(
+                video_id,
+                summaries[video_id],
+                ttl=(updated_on + video_info_cache_period - now).total_seconds(),
+            )
+    return summaries
+
+
+def get_cached_extracted_infos(video_ids: list[str]) -> dict[str, ExtractedInfo]:
+    """Get extracted_infos of many videos from memory and database cache.
+
+    Videos missing in memory are looked up in a single query. Ones not cached
+    or whose info has expired are left out.
+    """
+    extracted_infos: dict[str, ExtractedInfo] = {}
+    for video_id in video_ids:
+        extracted_info = extracted_info_cache.get(video_id)
+        if extracted_info is not None:
+            extracted_infos[video_id] = extracted_info
+
+    missing_ids = [
+        video_id for video_id in video_ids if video_id not in extracted_infos
+    ]
+    if not missing_ids:
+        return extracted_infos
+
+    query = select(VideoInfo).where(VideoInfo.id.in_(missing_ids))
+    with Session(bind=engine) as session:
+        for cached_extracted_info in session.exec(query):
+            if not cached_extracted_info.is_valid:
+                continue
+            extracted_info = cached_extracted_info.extracted_info
+            extracted_info_cache.set(
+                cached_extracted_info.id,
+                extracted_info,
+                ttl=cached_extracted_info.remaining_validity,
+            )
+            extracted_infos[cached_extracted_info.id] = extracted_info
+    return extracted_infos
+
+
+def load_extracted_info(yt: YoutubeDLBonus, url: str, video_id: str) -> ExtractedInfo:
+    """Load video's extracted_info from database or youtube and cache it in memory"""
     query = select(VideoInfo).where(VideoInfo.id == video_id)
     with Session(bind=engine) as session:
         cached_extracted_info: VideoInfo = session.exec(query).first()
-        if cached_extracted_info:
+        if cached_extracted_info and (
+            cached_extracted_info.is_valid or cached_extracted_info.is_within_grace
+        ):
+            extracted_info = cached_extracted_info.extracted_info
             if cached_extracted_info.is_valid:
-                return cached_extracted_info.extracted_info
+                ttl = cached_extracted_info.remaining_validity
             else:
-                cached_extracted_info.info = extracted_info.model_dump_json()
-                cached_extracted_info.updated_on = utc_now()
-                try:
-                    session.add(cached_extracted_info)
-                    session.commit()
-                except IntegrityError:
-                    pass
-                return extracted_info
-        else:
-            new_video_info = VideoInfo(
-                id=video_id, info=extracted_info.model_dump_json(), updated_on=utc_now()
+                schedule_video_info_refresh(yt, url, video_id)
+                ttl = cached_extracted_info.remaining_grace
+            extracted_info_cache.set(video_id, extracted_info, ttl=ttl)
+            return extracted_info
+
+    return refresh_extracted_info(yt, url, video_id)
+
+
+def refresh_extracted_info(
+    yt: YoutubeDLBonus, url: str, video_id: str
+) -> ExtractedInfo:
+    """Extract video's info from youtube and cache it in database and memory"""
+    extracted_info = extract_info_from_youtube(yt, url)
+    with Session(bind=engine) as session:
+        video_info = session.get(VideoInfo, video_id) or VideoInfo(id=video_id)
+        video_info.set_extracted_info(extracted_info)
+        try:
+            set_video_summary(video_info, yt, extracted_info)
+        except Exception as e:
+            # Computed again by `load_video_summary` once it's requested
+            logger.error(f"Failed to summarize info of video {video_id} - {e}")
+            video_info.summary = video_info.summary_format = None
+        video_info.updated_on = utc_now()
+        session.add(video_info)
+        try:
+            session.commit()
+        except IntegrityError:
+            # Concurrent request cached it first
+            session.rollback()
+
+    extracted_info_cache.set(
+        video_id, extracted_info, ttl=video_info_cache_period.total_seconds()
+    )
+    video_summary_cache.pop(video_id)
+    return extracted_info
+
+
+def record_video_info_access(video_id: str) -> t.NoReturn:
+    """Count a lookup of video's info towards it being refreshed ahead of expiry.
+    Nothing is counted while refreshing is disabled as nothing would pop it."""
+    if loaded_config.video_info_refresh_ahead_in_secs <= 0:
+        return
+    with video_info_accesses_lock:
+        video_info_accesses[video_id] += 1
+
+
+def pop_video_info_accesses() -> Counter[str]:
+    """Get lookups of video infos counted since the last call"""
+    global video_info_accesses
+    with video_info_accesses_lock:
+        accesses, video_info_accesses = video_info_accesses, Counter()
+    return accesses
+
+
+def schedule_video_info_refresh(yt: YoutubeDLBonus, url: str, video_id: str) -> bool:
+    """Refresh video's info in the background unless it's already being refreshed.
+
+    Returns:
+        bool: Whether a refresh was scheduled.
+    """
+    future, _, is_leader = video_info_refresh_flight.join(video_id)
+    if not is_leader:
+        return False
+    try:
+        video_info_refresh_executor.submit(
+            video_info_refresh_flight.run,
+            video_id,
+            future,
+            revalidate_extracted_info,
+            yt,
+            url,
+            video_id,
+        )
+    except RuntimeError:
+        # Executor has been shut down
+        video_info_refresh_flight.run(video_id, future, lambda: None)
+        return False
+    return True
+
+
+def revalidate_extracted_info(yt: YoutubeDLBonus, url: str, video_id: str):
+    try:
+        refresh_extracted_info(yt, url, video_id)
+    except Exception as e:
+        # Stale info keeps being served until the grace period ends
+        logger.warning(f"Failed to refresh info of video {video_id} - {e}")
+
+
+def normalize_search_query(query: str) -> str:
+    """Reduce a search query to the form its results are cached under"""
+    return " ".join(query.casefold().split())
+
+
+def get_search_results_key(query: str, continuation: str | None = None) -> str:
+    """Key a page of search results is cached under"""
+    query = normalize_search_query(query)
+    return f"{query}\n{continuation}" if continuation else query
+
+
+def encode_search_cursor(continuation: str | None, offset: int) -> str:
+    """Make a cursor pointing `offset` results past the continuation token"""
+    return urlsafe_b64encode(dumps([continuation, offset]).encode()).decode()
+
+
+def decode_search_cursor(cursor: str) -> tuple[str | None, int]:
+    """Get the continuation token and offset a cursor points to"""
+    try:
+        continuation, offset = loads(urlsafe_b64decode(cursor.encode()))
+        assert continuation is None or isinstance(continuation, str)
+        assert isinstance(offset, int) and offset >= 0
+    except Exception:
+        raise InvalidSearchCursor(f"Invalid search cursor - {cursor}")
+    return continuation, offset
+
+
+async def get_search_results(
+    query: str,
+    search: t.Callable[..., t.Awaitable[tuple[list[dict[str, str]], str | None]]],
+    continuation: str | None = None,
+    limit: int = None,
+) -> tuple[list[dict[str, str]], str | None]:
+    """Get videos matching query from cache or `search` accordingly.
+
+    Lookup order is memory, database then `search`. Every page of results is
+    cached whole so that queries differing only by limit share an entry.
+
+    Args:
+        query (str): Search keyword.
+        search (t.Callable): Called with the normalized query, continuation
+            token and `limit` to fetch results.
+        continuation (str | None, optional): Token of the results to start at.
+        limit (int, optional): Videos needed. Searches stop once they are found,
+            leaving the rest to the continuation token.
+
+    Returns:
+        tuple[list[dict[str, str]], str | None]: Videos found and the continuation
+            token of the results that follow.
+    """
+    key = get_search_results_key(query, continuation)
+    page = search_results_cache.get(key)
+    if page is not None:
+        return page
+
+    return await search_flight.do(
+        key, load_search_results, key, query, continuation, search, limit
+    )
+
+
+async def load_search_results(
+    key: str,
+    query: str,
+    continuation: str | None,
+    search: t.Callable[..., t.Awaitable[tuple[list[dict[str, str]], str | None]]],
+    limit: int = None,
+) -> tuple[list[dict[str, str]], str | None]:
+    """Load a page of results from database or `search` and cache it in memory"""
+    page = await find_search_results(key)
+    if page is not None:
+        return page
+
+    page = await search(normalize_search_query(query), continuation, limit)
+    await cache_search_results(key, *page)
+    return page
+
+
+async def find_search_results(key: str) -> tuple[list[dict[str, str]], str | None]:
+    """Get a page of results from the memory or database tiers of the cache"""
+    page = search_results_cache.get(key)
+    if page is not None:
+        return page
+
+    if async_engine is None:
+        cached_results = await anyio.to_thread.run_sync(get_cached_search_results, key)
+    else:
+        async with get_async_session() as session:
+            cached_results = await session.get(SearchResult, key)
+    if cached_results and cached_results.is_valid:
+        page = (cached_results.videos, cached_results.continuation)
+        search_results_cache.set(key, page, ttl=cached_results.remaining_validity)
+        return page
+
+
+async def cache_search_results(
+    key: str, results: list[dict[str, str]], continuation: str | None
+) -> t.NoReturn:
+    """Cache a page of results in both memory and database"""
+    if not results:
+        # Not worth caching, might be a transient failure
+        return
+
+    if async_engine is None:
+        await anyio.to_thread.run_sync(save_search_results, key, results, continuation)
+    else:
+        async with get_async_session() as session:
+            await session.merge(
+                SearchResult(
+                    query=key,
+                    results=dumps(results),
+                    continuation=continuation,
+                    updated_on=utc_now(),
+                )
             )
             try:
-                session.add(new_video_info)
-                session.commit()
+                await session.commit()
             except IntegrityError:
-                pass
+                # Concurrent request cached it first
+                await session.rollback()
+    search_results_cache.set(key, (results, continuation))
 
-            return extracted_info
+
+def get_cached_search_results(key: str) -> SearchResult | None:
+    with Session(bind=engine) as session:
+        return session.get(SearchResult, key)
+
+
+def save_search_results(
+    key: str, results: list[dict[str, str]], continuation: str | None
+) -> t.NoReturn:
+    with Session(bind=engine) as session:
+        session.merge(
+            SearchResult(
+                query=key,
+                results=dumps(results),
+                continuation=continuation,
+                updated_on=utc_now(),
+            )
+        )
+        try:
+            session.commit()
+        except IntegrityError:
+            # Concurrent request cached it first
+            session.rollback()
+
+
+def get_video_metadata_response(
+    yt: YoutubeDLBonus, extracted_info: ExtractedInfo
+) -> VideoMetadataResponse:
+    """Summarize a video's extracted_info"""
+    video_formats = yt.get_video_qualities_with_extension(
+        extracted_info,
+        ext=loaded_config.default_extension,
+        audio_ext=loaded_config.default_audio_format,
+    )
+    updated_video_formats = yt.update_audio_video_size(video_formats)
+    audio_formats = []
+    video_formats = []
+    for quality, format in updated_video_formats.items():
+        if quality in audioQualities:
+            audio_formats.append(
+                dict(
+                    quality=quality,
+                    size=get_size_string(format.audio_video_size),
+                )
+            )
+        else:
+            video_formats.append(
+                dict(
+                    quality=quality,
+                    size=get_size_string(format.audio_video_size),
+                )
+            )
+
+    return VideoMetadataResponse(
+        id=extracted_info.id,
+        title=extracted_info.title,
+        channel=extracted_info.channel,
+        uploader_url=extracted_info.uploader_url,
+        duration_string=extracted_info.duration_string,
+        thumbnail=extracted_info.thumbnail,
+        audio=audio_formats or [{"quality": "bestaudio"}],
+        video=video_formats or [{"quality": "best"}],
+        format=dict(
+            audio=loaded_config.default_audio_format,
+            video="mp4",
+        ),
+        others=dict(
+            like_count=extracted_info.like_count,
+            views_count=extracted_info.view_count,
+            categories=extracted_info.categories or [],
+            tags=extracted_info.tags or [],
+        ),
+    )
+
+
+class ProgressBroadcaster:
+    """Relays yt-dlp progress events of a download to every attached hook"""
+
+    def __init__(self):
+        self._hooks: list[t.Callable] = []
+        self._last_event: dict = None
+        self._lock = Lock()
+
+    def attach(self, hooks: list[t.Callable]) -> t.NoReturn:
+        """Start relaying events to hooks. Late hooks are caught up with the
+        latest event."""
+        with self._lock:
+            self._hooks.extend(hooks)
+            last_event = self._last_event
+        if last_event:
+            for hook in hooks:
+                self._call(hook, last_event)
+
+    def detach(self, hooks: list[t.Callable]) -> t.NoReturn:
+        """Stop relaying events to hooks"""
+        with self._lock:
+            for hook in hooks:
+                if hook in self._hooks:
+                    self._hooks.remove(hook)
+
+    def __call__(self, d: dict) -> t.NoReturn:
+        with self._lock:
+            self._last_event = d
+            hooks = list(self._hooks)
+        for hook in hooks:
+            self._call(hook, d)
+
+    def _call(self, hook: t.Callable, d: dict):
+        try:
+            hook(d)
+        except Exception as e:
+            # A failing client must not break the download
+            logger.error(f"Exception on progress hook ({hook.__name__}) - {e}")
+
+
+download_flight = SingleFlight(context_factory=ProgressBroadcaster)
+"""In-progress downloads mapped to their artifact keys"""
+
+
+def download_once(
+    key: str, progress_hooks: list[t.Callable], func: t.Callable, *args, **kwargs
+) -> t.Any:
+    """Run `func` unless an identical download is in progress, in which case
+    attach to it and wait for its result. `func` receives a `progress_hooks`
+    keyword argument that relays events to all attached clients."""
+    future, broadcaster, is_leader = download_flight.join(key)
+    broadcaster.attach(progress_hooks)
+    try:
+        if not is_leader:
+            return future.result()
+        return download_flight.run(
+            key, future, func, *args, progress_hooks=[broadcaster], **kwargs
+        )
+    finally:
+        broadcaster.detach(progress_hooks)
+
+
+def get_download_artifact_key(payload: MediaDownloadProcessPayload) -> str:
+    """Normalized identifier of the file a download request produces"""
+    video_id = get_video_id(payload.url)
+    bitrate = None if payload.quality in videoQualities else payload.bitrate
+    x_lang = payload.x_lang if loaded_config.embed_subtitles else None
+    return ":".join(
+        [video_id, payload.quality, bitrate or "-", (x_lang or "-").lower()]
+    )
+
+
+def get_download_artifact(key: str) -> DownloadArtifact | None:
+    """Get previously produced file of a download request.
+    Entries whose files no longer exist are deleted."""
+    with Session(bind=engine) as session:
+        artifact = session.get(DownloadArtifact, key)
+        if artifact is None:
+            return
+        if download_dir.joinpath(artifact.filename).is_file():
+            return artifact
+        logger.info(f"Dropping download artifact with missing file - {key}")
+        session.delete(artifact)
+        session.commit()
+
+
+def save_download_artifact(key: str, filepath: Path) -> DownloadArtifact:
+    """Index a produced file against its download request"""
+    artifact = DownloadArtifact(
+        key=key,
+        video_id=key.split(":")[0],
+        filename=filepath.name,
+        filesize=filepath.stat().st_size,
+        created_on=utc_now(),
+    )
+    with Session(bind=engine) as session:
+        artifact = session.merge(artifact)
+        session.commit()
+        session.refresh(artifact)
+    storage.request_check()
+    return artifact
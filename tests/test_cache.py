@@ -0,0 +1,63 @@
+import time
+from app.cache import TTLCache, SingleFlight, AsyncSingleFlight
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache("test-lru", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache("test-ttl", maxsize=2, ttl=60)
+    cache.set("a", 1, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats["expirations"] == 1
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Event
+
+    flight = SingleFlight()
+    release = Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "done"
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(flight.do, "key", work) for _ in range(4)]
+        while flight.in_flight == 0:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        release.set()
+        assert [future.result() for future in futures] == ["done"] * 4
+    assert len(calls) == 1
+
+
+def test_async_single_flight_coalesces_concurrent_calls():
+    import asyncio
+
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        return await asyncio.gather(*[flight.do("key", work) for _ in range(4)])
+
+    assert asyncio.run(main()) == ["done"] * 4
+    assert len(calls) == 1
+    assert flight.in_flight == 0
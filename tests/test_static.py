@@ -0,0 +1,53 @@
+import pytest
+from tests import client
+from app.config import download_dir
+
+content = bytes(range(256)) * 16
+
+
+@pytest.fixture
+def media_file():
+    filepath = download_dir.joinpath("static test.m4a")
+    filepath.write_bytes(content)
+    yield filepath
+    filepath.unlink()
+
+
+def test_static_file_range(media_file):
+    resp = client.get(
+        "/static/file/static%20test.m4a", headers={"Range": "bytes=10-19"}
+    )
+    assert resp.status_code == 206
+    assert resp.content == content[10:20]
+    assert resp.headers["content-range"] == f"bytes 10-19/{len(content)}"
+
+
+def test_static_file_etag_and_head(media_file):
+    resp = client.head("/static/file/static%20test.m4a")
+    assert resp.status_code == 200
+    assert resp.content == b""
+    assert resp.headers["content-length"] == str(len(content))
+    resp = client.get(
+        "/static/file/static%20test.m4a",
+        headers={"If-None-Match": resp.headers["etag"]},
+    )
+    assert resp.status_code == 304
+
+
+def test_static_file_outside_download_dir():
+    assert client.get("/static/file/..%2Fapp%2F__init__.py").status_code == 404
+    assert client.get("/static/file/missing.m4a").status_code == 404
+
+
+def test_static_file_accesses_count_whole_transfers_only(media_file, monkeypatch):
+    from app.storage import storage
+
+    accessed = []
+    monkeypatch.setattr(storage, "record_access", accessed.append)
+    url = "/static/file/static%20test.m4a"
+    etag = client.get(url).headers["etag"]
+    client.get(url, headers={"Range": "bytes=0-99"})
+    client.get(url, headers={"Range": "bytes=100-199"})
+    client.get(url, headers={"If-None-Match": etag})
+    client.head(url)
+    assert accessed == [media_file.name, media_file.name]
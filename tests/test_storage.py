@@ -0,0 +1,37 @@
+import time
+from sqlmodel import Session
+from app.db import DownloadArtifact, create_tables, engine
+from app.storage import StorageManager
+from app.v1.utils import save_download_artifact
+
+
+def test_least_recently_served_files_are_evicted(tmp_path):
+    create_tables()
+    manager = StorageManager(
+        directory=tmp_path,
+        max_size=300,
+        high_watermark=1,
+        low_watermark=1,
+        policy="lru",
+        interval_in_secs=300,
+    )
+    files = []
+    in_progress = tmp_path.joinpath("storage-test.mp4.part")
+    for index in range(3):
+        filepath = tmp_path.joinpath(f"storage-test-{index}.mp4")
+        files.append(filepath)
+        filepath.write_bytes(b"m" * 100)
+        save_download_artifact(f"storage-test-{index}:720p:-:-", filepath)
+    in_progress.write_bytes(b"m" * 100)
+    time.sleep(0.01)
+    manager.record_access(files[0].name)
+    with manager.serving(files[1].name):
+        report = manager.check()
+    assert report["evicted_files"] == 1
+    assert not files[2].exists()
+    assert files[0].exists() and files[1].exists() and in_progress.exists()
+    with Session(bind=engine) as session:
+        assert session.get(DownloadArtifact, "storage-test-2:720p:-:-") is None
+        assert (
+            session.get(DownloadArtifact, "storage-test-0:720p:-:-").access_count == 1
+        )
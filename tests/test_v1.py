@@ -2,6 +2,7 @@ import pytest
 from tests import client
 import app.v1.models as models
 from app.events import event_startup_create_tempdirs, event_startup_create_tables
+from app.utils import get_video_id, get_playlist_url, get_channel_url
 
 video_link = "https://youtu.be/S3wsCRJVUyg?si=SjN17MR1-u7BPgxk?si=svRtQPHef9TSMABt"
 # https://youtu.be/R3GfuzLMPkA?si=YItOxtgw3LAjKps1
@@ -62,3 +63,1063 @@ def test_download_processing(url, quality, bitrate):
     # This will raise 404 since the static contents are served by flask (wsgi).
     # static_resp = client.get(str(media.link))
     # assert static_resp.is_success
+
+
+@pytest.mark.parametrize(
+    ["url"],
+    [
+        ("https://youtu.be/HUGcwe93F9E?si=Ajunj8GlRs-DzKnQ",),
+        ("HUGcwe93F9E",),
+        ("https://www.youtube.com/watch?v=HUGcwe93F9E",),
+        ("https://www.youtube.com/embed/HUGcwe93F9E",),
+    ],
+)
+def test_get_video_id(url):
+    assert get_video_id(url) == "HUGcwe93F9E"
+
+
+@pytest.mark.parametrize(
+    ["url"],
+    [
+        ("https://www.youtube.com/playlist?list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG",),
+        ("https://youtu.be/HUGcwe93F9E?list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG",),
+        ("PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG",),
+    ],
+)
+def test_get_playlist_url(url):
+    assert get_playlist_url(url) == (
+        "https://www.youtube.com/playlist?list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG"
+    )
+
+
+@pytest.mark.parametrize(
+    ["url", "channel_url"],
+    [
+        (
+            "https://www.youtube.com/@Marioo/shorts",
+            "https://www.youtube.com/@Marioo/videos",
+        ),
+        ("@Marioo", "https://www.youtube.com/@Marioo/videos"),
+        (
+            "UC2Xd-TjJByJyK2w1zNwY0zQ",
+            "https://www.youtube.com/channel/UC2Xd-TjJByJyK2w1zNwY0zQ/videos",
+        ),
+    ],
+)
+def test_get_channel_url(url, channel_url):
+    assert get_channel_url(url) == channel_url
+
+
+def test_download_artifact_is_dropped_with_its_file():
+    from app.config import download_dir
+    from app.v1.utils import (
+        get_download_artifact_key,
+        get_download_artifact,
+        save_download_artifact,
+    )
+
+    payload = models.MediaDownloadProcessPayload(
+        url="HUGcwe93F9E", quality="720p", bitrate="128k"
+    )
+    key = get_download_artifact_key(payload)
+    assert key == "HUGcwe93F9E:720p:-:-"
+    filepath = download_dir.joinpath("artifact-test.mp4")
+    filepath.write_bytes(b"media")
+    assert save_download_artifact(key, filepath).filesize == 5
+    assert get_download_artifact(key).filename == filepath.name
+    filepath.unlink()
+    assert get_download_artifact(key) is None
+
+
+def test_identical_downloads_run_once():
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Event
+    from app.v1.utils import download_once
+
+    release = Event()
+    downloads = []
+    received = []
+
+    def download(progress_hooks):
+        downloads.append(1)
+        release.wait(5)
+        for hook in progress_hooks:
+            hook({"status": "finished"})
+        return "artifact"
+
+    def request_download():
+        return download_once("test-key", [received.append], download)
+
+    with ThreadPoolExecutor(3) as executor:
+        futures = [executor.submit(request_download) for _ in range(3)]
+        time.sleep(0.05)
+        release.set()
+        assert [future.result() for future in futures] == ["artifact"] * 3
+    assert len(downloads) == 1
+    assert len(received) == 3
+
+
+def test_download_jobs_fair_share_and_backpressure():
+    from threading import Event
+    from app.exceptions import DownloadQueueFull
+    from app.v1.jobs import DownloadJobQueue
+
+    release = Event()
+    served = []
+
+    def handler(request, payload, progress_hooks):
+        release.wait(5)
+        served.append(request)
+        return request
+
+    queue = DownloadJobQueue(
+        handler, workers=1, max_queued=4, max_queued_per_client=2, retention_in_secs=60
+    )
+    payload = models.MediaDownloadProcessPayload(url="HUGcwe93F9E", quality="medium")
+    blocker = queue.submit("c", "c0", payload)
+    while blocker.status != "running":
+        pass
+    jobs = [
+        queue.submit("a", "a1", payload),
+        queue.submit("a", "a2", payload),
+        queue.submit("b", "b1", payload),
+    ]
+    with pytest.raises(DownloadQueueFull):
+        queue.submit("a", "a3", payload)
+    release.set()
+    assert [job.future.result(5) for job in jobs] == ["a1", "a2", "b1"]
+    assert served == ["c0", "a1", "b1", "a2"]
+    assert queue.get(jobs[0].id).status == "done"
+    queue.stop()
+
+
+def test_stopped_download_jobs_queue_fails_queued_jobs():
+    from threading import Event
+    from fastapi import HTTPException
+    from app.exceptions import DownloadQueueStopped
+    from app.v1.jobs import DownloadJobQueue
+
+    release = Event()
+
+    def handler(request, payload, progress_hooks):
+        release.wait(5)
+        return request
+
+    queue = DownloadJobQueue(
+        handler, workers=1, max_queued=4, max_queued_per_client=2, retention_in_secs=60
+    )
+    payload = models.MediaDownloadProcessPayload(url="HUGcwe93F9E", quality="medium")
+    running = queue.submit("a", "a0", payload)
+    while running.status != "running":
+        pass
+    queued = queue.submit("b", "b1", payload)
+    queue.stop()
+    assert queued.status == "failed"
+    with pytest.raises(HTTPException) as e:
+        queued.future.result(5)
+    assert e.value.status_code == 503
+    with pytest.raises(DownloadQueueStopped):
+        queue.submit("a", "a1", payload)
+    release.set()
+    assert running.future.result(5) == "a0"
+    assert queue.stats["queued"] == 0
+
+
+def test_websocket_progress_is_throttled(monkeypatch):
+    import time
+    from app.v1 import routes
+
+    def handler(request, payload, progress_hooks):
+        time.sleep(0.2)
+        for downloaded in range(101):
+            for hook in progress_hooks:
+                hook(
+                    dict(
+                        status="downloading",
+                        downloaded_bytes=downloaded,
+                        total_bytes=100,
+                        speed=1024,
+                        eta=1,
+                        filename="audio.m4a",
+                    )
+                )
+        for hook in progress_hooks:
+            hook(dict(status="finished", filename="audio.m4a"))
+        return models.MediaDownloadResponse(
+            is_success=True, filename="audio.m4a", filesize="100 B", link="audio.m4a"
+        )
+
+    monkeypatch.setattr(routes.download_jobs, "handler", handler)
+    with client.websocket_connect("/api/v1/download/ws") as websocket:
+        websocket.send_json(dict(url="HUGcwe93F9E", quality="medium"))
+        statuses = []
+        while not statuses or statuses[-1] not in ("completed", "error"):
+            statuses.append(websocket.receive_json()["status"])
+    assert statuses == [
+        "queued",
+        "downloading",
+        "downloading",
+        "finished",
+        "completed",
+    ]
+
+
+def test_websocket_job_failure_is_reported(monkeypatch):
+    from app.v1 import routes
+
+    def handler(request, payload, progress_hooks):
+        raise RuntimeError("Unexpected")
+
+    monkeypatch.setattr(routes.download_jobs, "handler", handler)
+    with client.websocket_connect("/api/v1/download/ws") as websocket:
+        websocket.send_json(dict(url="HUGcwe93F9E", quality="medium"))
+        response = websocket.receive_json()
+        while response["status"] not in ("completed", "error"):
+            response = websocket.receive_json()
+    assert response["status"] == "error"
+    assert response["detail"]["status_code"] == 500
+    assert "text" in response["detail"]
+
+
+def test_client_id_trusts_forwarded_for_when_configured(monkeypatch):
+    from starlette.requests import Request
+    from app.config import loaded_config
+    from app.utils import get_client_id
+
+    request = Request(
+        dict(
+            type="http",
+            headers=[(b"x-forwarded-for", b"203.0.113.7, 10.0.0.1")],
+            client=("10.0.0.1", 50000),
+        )
+    )
+    assert get_client_id(request) == "10.0.0.1"
+    monkeypatch.setattr(loaded_config, "trust_forwarded_for", True)
+    assert get_client_id(request) == "203.0.113.7"
+
+
+def make_extracted_info(video_id: str, title: str):
+    from yt_dlp_bonus.models import ExtractedInfo
+
+    return ExtractedInfo(
+        id=video_id,
+        title=title,
+        formats=[
+            dict(
+                format_id="140",
+                format_note="medium",
+                ext="m4a",
+                protocol="https",
+                acodec="mp4a.40.2",
+                vcodec="none",
+                url="https://media.test/140",
+                resolution="audio only",
+            )
+        ],
+        thumbnails=[],
+        thumbnail=f"https://i.ytimg.com/vi/{video_id}/sddefault.jpg",
+        description="",
+        channel_id="channel",
+        channel_url="https://www.youtube.com/channel/channel",
+        view_count=1,
+        age_limit=0,
+        webpage_url=f"https://www.youtube.com/watch?v={video_id}",
+        tags=[],
+        playable_in_embed=True,
+        live_status="not_live",
+        automatic_captions={},
+        subtitles={},
+        channel="channel",
+        uploader="uploader",
+        original_url=video_id,
+        webpage_url_basename="watch",
+        webpage_url_domain="youtube.com",
+        extractor="youtube",
+        extractor_key="Youtube",
+    )
+
+
+def test_download_stream_persists_media(monkeypatch):
+    import httpx
+    from app.config import download_dir
+    from app.v1 import routes, streaming
+
+    media = b"audio-bytes" * 1000
+    extracted_info = make_extracted_info("HUGcwe93F9E", "Stream test")
+
+    def respond(request: httpx.Request):
+        start, end = map(int, request.headers["Range"][6:].split("-"))
+        return httpx.Response(
+            206,
+            content=media[start : end + 1],
+            headers={"Content-Range": f"bytes {start}-{end}/{len(media)}"},
+        )
+
+    monkeypatch.setattr(
+        streaming,
+        "media_client",
+        httpx.AsyncClient(transport=httpx.MockTransport(respond)),
+    )
+    monkeypatch.setattr(streaming.loaded_config, "stream_chunk_size", 4096)
+    monkeypatch.setattr(
+        routes, "get_downloadable_extracted_info", lambda yt, url: extracted_info
+    )
+    monkeypatch.setattr(routes.loaded_config, "default_audio_format", "m4a")
+
+    resp = client.get(
+        "/api/v1/download/stream", params=dict(url="HUGcwe93F9E", quality="medium")
+    )
+    assert resp.status_code == 200
+    assert resp.content == media
+    saved = download_dir.joinpath("Stream test (medium).m4a")
+    assert saved.read_bytes() == media
+    saved.unlink()
+
+
+def make_search_response(video_ids: list[str], continuation: str = None) -> dict:
+    sections = [
+        {
+            "itemSectionRenderer": {
+                "contents": [
+                    {
+                        "videoRenderer": {
+                            "videoId": video_id,
+                            "title": {"runs": [{"text": "Title"}]},
+                            "lengthText": {"simpleText": "1:00"},
+                        }
+                    }
+                    for video_id in video_ids
+                ]
+            }
+        }
+    ]
+    if continuation:
+        sections.append(
+            {
+                "continuationItemRenderer": {
+                    "continuationEndpoint": {
+                        "continuationCommand": {"token": continuation}
+                    }
+                }
+            }
+        )
+    return {
+        "contents": {
+            "twoColumnSearchResultsRenderer": {
+                "primaryContents": {"sectionListRenderer": {"contents": sections}}
+            }
+        }
+    }
+
+
+def test_search_results_are_cached_once_for_all_limits(monkeypatch):
+    from uuid import uuid4
+    from app.v1 import search as innertube_search
+    from app.v1.utils import search_results_cache
+
+    query = f"Cached  Query {uuid4().hex}"
+    searched = []
+
+    async def search(query=None, params=None, continuation=None):
+        searched.append(query)
+        return make_search_response([f"video{index}" for index in range(5)])
+
+    monkeypatch.setattr(innertube_search.innertube_client, "search", search)
+    search_results_cache.clear()
+    resp = client.get("/api/v1/search", params=dict(q=query, limit=2))
+    assert len(resp.json()["results"]) == 2
+    search_results_cache.clear()  # Served from database
+    resp = client.get("/api/v1/search", params=dict(q=f"{query.lower()} ", limit=4))
+    assert len(resp.json()["results"]) == 4
+    assert searched == [" ".join(query.lower().split())]
+
+
+@pytest.fixture
+def paged_search(monkeypatch):
+    from uuid import uuid4
+    from app.v1 import search as innertube_search
+
+    continuations = []
+
+    async def search(query=None, params=None, continuation=None):
+        continuations.append(continuation)
+        if continuation is None:
+            return make_search_response(["a", "b", "c"], continuation="page-2")
+        return {
+            "onResponseReceivedCommands": [
+                {
+                    "appendContinuationItemsAction": {
+                        "continuationItems": make_search_response(["c", "d", "e"])[
+                            "contents"
+                        ]["twoColumnSearchResultsRenderer"]["primaryContents"][
+                            "sectionListRenderer"
+                        ][
+                            "contents"
+                        ]
+                    }
+                }
+            ]
+        }
+
+    monkeypatch.setattr(innertube_search.innertube_client, "search", search)
+    yield f"paged {uuid4().hex}", continuations
+
+
+def test_search_pagination(paged_search):
+    query, continuations = paged_search
+    resp = client.get("/api/v1/search", params=dict(q=query, limit=2))
+    page = models.SearchVideosResponse(**resp.json())
+    assert [video.id for video in page.results] == ["a", "b"]
+    assert continuations == [None]  # First page had enough
+    resp = client.get("/api/v1/search", params=dict(q=query, limit=2, next=page.next))
+    page = models.SearchVideosResponse(**resp.json())
+    assert [video.id for video in page.results] == ["c"]
+    resp = client.get("/api/v1/search", params=dict(q=query, limit=3, next=page.next))
+    page = models.SearchVideosResponse(**resp.json())
+    # Pages are deduplicated within a search only
+    assert [video.id for video in page.results] == ["c", "d", "e"]
+    assert page.next is None
+    assert continuations == [None, "page-2"]
+    resp = client.get("/api/v1/search", params=dict(q=query, next="invalid"))
+    assert resp.status_code == 400
+
+
+def test_search_results_streaming(paged_search):
+    import json
+
+    query, _ = paged_search
+    resp = client.get("/api/v1/search/stream", params=dict(q=query, limit=4))
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["video"]["id"] for line in lines[:-1]] == ["a", "b", "c", "d"]
+    resp = client.get(
+        "/api/v1/search/stream",
+        params=dict(q=query, limit=4, next=lines[-1]["next"], format="sse"),
+    )
+    assert resp.text.split("\n\n")[:2] == [
+        'event: video\ndata: {"id": "e", "title": "Title", "duration": "1:00"}',
+        "event: next\ndata: null",
+    ]
+
+
+def test_metadata_batch(monkeypatch):
+    from uuid import uuid4
+    from app.v1 import routes
+    from app.v1.utils import (
+        get_extracted_info,
+        extracted_info_cache,
+        video_summary_cache,
+    )
+
+    cached_id, missing_id = uuid4().hex[:11], uuid4().hex[:11]
+    extracted = []
+
+    def extract_info_from_youtube(yt, url):
+        extracted.append(get_video_id(url))
+        return make_extracted_info(get_video_id(url), "Batch test")
+
+    monkeypatch.setattr(routes.loaded_config, "default_audio_format", "m4a")
+    monkeypatch.setattr(
+        "app.v1.utils.extract_info_from_youtube", extract_info_from_youtube
+    )
+    get_extracted_info(routes.yt, cached_id)  # Cached in database
+    extracted_info_cache.clear()
+    video_summary_cache.clear()
+    extracted.clear()
+
+    def expand_extracted_info(data):
+        raise AssertionError("Cached summaries should not parse the video info")
+
+    monkeypatch.setattr("app.db.expand_extracted_info", expand_extracted_info)
+    resp = client.post(
+        "/api/v1/metadata/batch",
+        json=dict(urls=[cached_id, missing_id, missing_id, "invalid"]),
+    )
+    assert resp.is_success
+    results = resp.json()["results"]
+    assert [result["metadata"]["id"] for result in results[:3]] == [
+        cached_id,
+        missing_id,
+        missing_id,
+    ]
+    assert results[0]["metadata"]["title"] == "Batch test"
+    assert results[3]["error"]["status_code"] == 400
+    assert extracted == [missing_id]
+
+
+def test_playlist_expansion_and_warm_up(monkeypatch):
+    from threading import Event
+    from app.v1 import routes, playlists
+
+    warmed_up = Event()
+    monkeypatch.setattr(
+        playlists.flat_yt,
+        "extract_info",
+        lambda url, download: dict(
+            id="PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG",
+            title="Playlist test",
+            uploader="uploader",
+            entries=[
+                dict(ie_key="Youtube", id="HUGcwe93F9E", title="One", duration=75),
+                dict(ie_key="Youtube", id="S3wsCRJVUyg", title="[Private video]"),
+                dict(ie_key="Youtube", id="R3GfuzLMPkA", title=None, duration=30),
+                dict(ie_key="YoutubeTab", id="UU2Xd-TjJByJyK2w1zNwY0zQ"),
+            ],
+        ),
+    )
+    monkeypatch.setattr(routes, "get_cached_extracted_infos", lambda video_ids: {})
+    monkeypatch.setattr(
+        routes, "get_extracted_info", lambda yt, video_id: warmed_up.set()
+    )
+    resp = client.get(
+        "/api/v1/playlist",
+        params=dict(url="PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG", warm_up=True),
+    )
+    assert resp.is_success
+    playlist = models.PlaylistResponse(**resp.json())
+    assert playlist.channel == "uploader"
+    assert [(entry.id, entry.title, entry.duration) for entry in playlist.entries] == [
+        ("HUGcwe93F9E", "One", "1:15"),
+        ("R3GfuzLMPkA", "", "30"),
+    ]
+    assert playlist.warming_up == 2
+    assert warmed_up.wait(5)
+    assert (
+        client.get("/api/v1/channel", params=dict(url="not a channel")).status_code
+        == 400
+    )
+
+
+def test_playlist_download_archive(monkeypatch):
+    import time
+    from uuid import uuid4
+    from zipfile import ZipFile, ZIP_STORED
+    from app.config import download_dir
+    from app.v1 import routes
+    from app.v1.utils import save_download_artifact
+
+    playlist_id = f"PL{uuid4().hex}"
+    monkeypatch.setattr(
+        routes,
+        "expand_playlist",
+        lambda url: dict(
+            id=playlist_id,
+            title="Archive test",
+            channel=None,
+            entries=[
+                dict(id=video_id)
+                for video_id in ["aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"]
+            ],
+        ),
+    )
+
+    def fetch_download_artifact(payload):
+        if payload.url == "bbbbbbbbbbb":
+            raise Exception("Unavailable")
+        filepath = download_dir.joinpath(f"{payload.url}.m4a")
+        filepath.write_bytes(payload.url.encode())
+        return save_download_artifact(f"{payload.url}:medium:-:-", filepath)
+
+    def run_playlist_job(**payload) -> dict:
+        resp = client.post(
+            "/api/v1/jobs/playlist", json=dict(url=playlist_id, **payload)
+        )
+        assert resp.status_code == 202
+        job_id = resp.json()["id"]
+        for _ in range(100):
+            job = client.get(f"/api/v1/jobs/{job_id}").json()
+            if job["status"] in ("done", "failed"):
+                break
+            time.sleep(0.05)
+        assert job["status"] == "done", job
+        return job
+
+    monkeypatch.setattr(routes, "fetch_download_artifact", fetch_download_artifact)
+    job = run_playlist_job(quality="medium")
+    archive_path = download_dir.joinpath(job["result"]["filename"])
+    assert archive_path.name.startswith("Archive test (medium) ")
+    bitrate_job = run_playlist_job(quality="medium", bitrate="128k")
+    bitrate_archive_path = download_dir.joinpath(bitrate_job["result"]["filename"])
+    assert bitrate_archive_path.name.startswith("Archive test (medium, 128k) ")
+    with ZipFile(archive_path) as archive:
+        assert sorted(archive.namelist()) == [
+            "001 - aaaaaaaaaaa.m4a",
+            "003 - ccccccccccc.m4a",
+        ]
+        assert archive.read("003 - ccccccccccc.m4a") == b"ccccccccccc"
+        assert {info.compress_type for info in archive.infolist()} == {ZIP_STORED}
+    for filename in [
+        archive_path.name,
+        bitrate_archive_path.name,
+        "aaaaaaaaaaa.m4a",
+        "ccccccccccc.m4a",
+    ]:
+        download_dir.joinpath(filename).unlink()
+
+
+def test_video_info_compaction():
+    from uuid import uuid4
+    from sqlmodel import Session
+    from app.db import VideoInfo, compact_video_infos, engine
+
+    extracted_info = make_extracted_info(uuid4().hex[:11], "Compact test")
+    extracted_info.formats.append(
+        extracted_info.formats[0].model_copy(
+            update=dict(format_id="sb0", ext="mhtml", format_note="storyboard")
+        )
+    )
+    legacy_ids = [uuid4().hex[:11] for _ in range(2)]
+    with Session(bind=engine) as session:
+        session.add(
+            VideoInfo(id=extracted_info.id, info=extracted_info.model_dump_json())
+        )
+        # Unreadable legacy rows
+        session.add(VideoInfo(id=legacy_ids[0], info="[]"))
+        session.add(VideoInfo(id=legacy_ids[1], info='{"id": 1}'))
+        session.commit()
+    assert compact_video_infos() >= 3
+    with Session(bind=engine) as session:
+        assert all(session.get(VideoInfo, video_id) is None for video_id in legacy_ids)
+        video_info = session.get(VideoInfo, extracted_info.id)
+        assert video_info.info == ""
+        assert len(video_info.data) < len(extracted_info.model_dump_json())
+        compacted = video_info.extracted_info
+    assert [format.format_id for format in compacted.formats] == ["140"]
+    assert compacted.model_dump(
+        exclude={"formats", "description", "thumbnails"}
+    ) == extracted_info.model_dump(exclude={"formats", "description", "thumbnails"})
+
+
+def test_video_metadata_is_served_from_precomputed_summary(monkeypatch):
+    from uuid import uuid4
+    from app.v1 import routes
+    from app.v1.utils import extracted_info_cache, video_summary_cache
+
+    video_id = uuid4().hex[:11]
+    extracted = []
+
+    def extract_info_from_youtube(yt, url):
+        extracted.append(url)
+        return make_extracted_info(video_id, "Summary test")
+
+    monkeypatch.setattr(routes.loaded_config, "default_audio_format", "m4a")
+    monkeypatch.setattr(
+        "app.v1.utils.extract_info_from_youtube", extract_info_from_youtube
+    )
+    resp = client.get("/api/v1/metadata", params=dict(url=video_id))
+    assert resp.is_success
+    assert models.VideoMetadataResponse(**resp.json()).title == "Summary test"
+    etag = resp.headers["etag"]
+
+    extracted_info_cache.clear()
+    video_summary_cache.clear()
+
+    def expand_extracted_info(data):
+        raise AssertionError("Summary hit should not parse the video info")
+
+    monkeypatch.setattr("app.db.expand_extracted_info", expand_extracted_info)
+    resp = client.get("/api/v1/metadata", params=dict(url=video_id))
+    assert resp.is_success and resp.headers["etag"] == etag
+    resp = client.get(
+        "/api/v1/metadata", params=dict(url=video_id), headers={"If-None-Match": etag}
+    )
+    assert resp.status_code == 304
+    assert len(extracted) == 1
+
+
+def test_video_summary_failures_and_expiry(monkeypatch):
+    from uuid import uuid4
+    from sqlmodel import Session
+    from app.db import VideoInfo, engine
+    from app.v1 import routes, utils
+
+    video_id = uuid4().hex[:11]
+    monkeypatch.setattr(routes.loaded_config, "default_audio_format", "m4a")
+    monkeypatch.setattr(
+        utils,
+        "extract_info_from_youtube",
+        lambda yt, url: make_extracted_info(video_id, "Summary failure test"),
+    )
+
+    def get_video_metadata_response(yt, extracted_info):
+        raise KeyError("Unusual formats")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(
+            utils, "get_video_metadata_response", get_video_metadata_response
+        )
+        assert utils.get_extracted_info(routes.yt, video_id).id == video_id
+    with Session(bind=engine) as session:
+        assert session.get(VideoInfo, video_id).summary is None
+    summary, _ = utils.get_video_summary(routes.yt, video_id)
+    assert b"Summary failure test" in summary
+
+    with Session(bind=engine) as session:
+        session.delete(session.get(VideoInfo, video_id))
+        session.commit()
+    utils.video_summary_cache.clear()
+    # Info served from memory is summarized without being cached again
+    summary, _ = utils.get_video_summary(routes.yt, video_id)
+    assert b"Summary failure test" in summary
+    with Session(bind=engine) as session:
+        assert session.get(VideoInfo, video_id) is None
+    assert utils.video_summary_cache.get(video_id) is None
+
+
+def test_stale_video_info_is_served_while_refreshed(monkeypatch):
+    import time
+    from uuid import uuid4
+    from threading import Event
+    from datetime import timedelta
+    from sqlmodel import Session
+    from app.config import loaded_config
+    from app.db import VideoInfo, engine, video_info_cache_period
+    from app.utils import utc_now
+    from app.v1.downloads import yt
+    from app.v1.refresh import HotVideoInfoRefresher
+    from app.v1.utils import (
+        get_extracted_info,
+        extracted_info_cache,
+        video_info_refresh_flight,
+        record_video_info_access,
+        pop_video_info_accesses,
+    )
+
+    stale_id, hot_id = uuid4().hex[:11], uuid4().hex[:11]
+    with Session(bind=engine) as session:
+        for video_id, age in [
+            (stale_id, video_info_cache_period + timedelta(minutes=1)),
+            (hot_id, video_info_cache_period - timedelta(minutes=1)),
+        ]:
+            video_info = VideoInfo(id=video_id, updated_on=utc_now() - age)
+            video_info.set_extracted_info(make_extracted_info(video_id, "Stale"))
+            session.add(video_info)
+        session.commit()
+
+    release = Event()
+    extracted = []
+
+    def extract_info_from_youtube(yt, url):
+        extracted.append(get_video_id(url))
+        release.wait(5)
+        return make_extracted_info(get_video_id(url), "Fresh")
+
+    monkeypatch.setattr(
+        "app.v1.utils.extract_info_from_youtube", extract_info_from_youtube
+    )
+
+    def wait_for_refreshes():
+        release.set()
+        for _ in range(100):
+            if not video_info_refresh_flight.in_flight:
+                break
+            time.sleep(0.05)
+
+    try:
+        assert get_extracted_info(yt, stale_id).title == "Stale"
+        extracted_info_cache.pop(stale_id)
+        assert get_extracted_info(yt, stale_id).title == "Stale"
+    finally:
+        wait_for_refreshes()
+    assert extracted == [stale_id]
+    assert get_extracted_info(yt, stale_id).title == "Fresh"
+    with Session(bind=engine) as session:
+        assert session.get(VideoInfo, stale_id).is_valid
+
+    pop_video_info_accesses()
+    for _ in range(3):
+        record_video_info_access(hot_id)
+    record_video_info_access(stale_id)
+    refresher = HotVideoInfoRefresher(refresh_ahead_in_secs=600, min_accesses=3)
+    refresher.yt = yt
+    assert refresher.check() == [hot_id]
+    wait_for_refreshes()
+    assert extracted == [stale_id, hot_id]
+    assert get_extracted_info(yt, hot_id).title == "Fresh"
+
+    pop_video_info_accesses()
+    monkeypatch.setattr(loaded_config, "video_info_refresh_ahead_in_secs", 0)
+    record_video_info_access(hot_id)
+    assert not pop_video_info_accesses()
+
+
+def test_expired_stream_urls_are_re_extracted_for_downloads_only(monkeypatch):
+    import time
+    from uuid import uuid4
+    from app.db import VideoInfo, get_streams_expire_on
+    from app.v1.downloads import yt
+    from app.v1.utils import (
+        get_extracted_info,
+        get_downloadable_extracted_info,
+        extracted_info_cache,
+    )
+
+    def make_streamed_info(video_id: str, title: str, expire: int):
+        extracted_info = make_extracted_info(video_id, title)
+        extracted_info.formats = [
+            extracted_info.formats[0].model_copy(
+                update=dict(url=f"https://media.test/videoplayback?expire={expire}")
+            ),
+            extracted_info.formats[0].model_copy(
+                update=dict(
+                    format_id="140-dash",
+                    url=f"https://media.test/api/manifest/dash/expire/{expire + 60}/id",
+                )
+            ),
+        ]
+        return extracted_info
+
+    video_id = uuid4().hex[:11]
+    extracted = []
+
+    def extract_info_from_youtube(yt, url):
+        extracted.append(url)
+        return make_streamed_info(
+            video_id,
+            "Fresh streams" if extracted[1:] else "Expiring streams",
+            int(time.time()) + (21600 if extracted[1:] else 60),
+        )
+
+    monkeypatch.setattr(
+        "app.v1.utils.extract_info_from_youtube", extract_info_from_youtube
+    )
+    expiring = make_streamed_info(video_id, "Expiring", 1_700_000_000)
+    assert get_streams_expire_on(expiring).timestamp() == 1_700_000_000
+    video_info = VideoInfo(id=video_id)
+    video_info.set_extracted_info(expiring)
+    assert video_info.streams_expire_on and not video_info.has_usable_streams
+
+    assert get_extracted_info(yt, video_id).title == "Expiring streams"
+    extracted_info_cache.pop(video_id)
+    assert get_extracted_info(yt, video_id).title == "Expiring streams"
+    assert len(extracted) == 1
+    assert get_downloadable_extracted_info(yt, video_id).title == "Fresh streams"
+    assert get_downloadable_extracted_info(yt, video_id).title == "Fresh streams"
+    extracted_info_cache.pop(video_id)
+    assert get_downloadable_extracted_info(yt, video_id).title == "Fresh streams"
+    assert len(extracted) == 2
+
+
+def test_parallel_range_download(monkeypatch, tmp_path):
+    import httpx
+    from threading import Lock
+    from yt_dlp import YoutubeDL
+    from app.v1 import ranges
+
+    media = bytes(range(256)) * 200
+    requested_ranges = []
+    lock = Lock()
+
+    def respond(request: httpx.Request):
+        start, end = map(int, request.headers["Range"][6:].split("-"))
+        with lock:
+            throttle = start == 8192 and (start, end) not in requested_ranges
+            requested_ranges.append((start, end))
+        if throttle:
+            return httpx.Response(429)
+        return httpx.Response(
+            206,
+            content=media[start : end + 1],
+            headers={"Content-Range": f"bytes {start}-{end}/{len(media)}"},
+        )
+
+    monkeypatch.setattr(
+        ranges, "range_client", httpx.Client(transport=httpx.MockTransport(respond))
+    )
+    monkeypatch.setattr(ranges.loaded_config, "download_range_chunk_size", 4096)
+    monkeypatch.setattr(ranges.loaded_config, "download_range_max_connections", 4)
+
+    ydl = YoutubeDL(dict(quiet=True, noprogress=True, retries=2))
+    downloader = ranges.ParallelHttpFD(ydl, ydl.params)
+    progress = []
+    downloader.add_progress_hook(lambda d: progress.append(d["status"]))
+    filepath = tmp_path.joinpath("media.m4a")
+    assert downloader.download(
+        str(filepath), dict(url="https://media.test/videoplayback", http_headers={})
+    ) == (True, True)
+    assert filepath.read_bytes() == media
+    assert not tmp_path.joinpath("media.m4a.part").exists()
+    assert len(requested_ranges) == len(media) // 4096 + 2
+    assert progress[-1] == "finished" and "downloading" in progress
+
+    controller = ranges.ConcurrencyController(initial=2, maximum=4)
+    for _ in range(2):
+        controller.completed(4096)
+    assert controller.concurrency == 3
+    controller.throttled()
+    assert controller.concurrency == 1
+
+
+def test_merged_format_streams_are_fetched_concurrently(monkeypatch, tmp_path):
+    import importlib
+    from threading import Barrier
+    from yt_dlp import YoutubeDL
+    from yt_dlp.downloader.common import FileDownloader
+    from app.v1 import merging
+
+    barrier = Barrier(2, timeout=5)
+
+    class StreamFD(FileDownloader):
+        def real_download(self, filename, info_dict):
+            barrier.wait()
+            self._hook_progress(
+                dict(status="downloading", downloaded_bytes=1, total_bytes=2),
+                info_dict,
+            )
+            with open(filename, "w") as fh:
+                fh.write(info_dict["format_id"])
+            self._hook_progress(dict(status="finished", filename=filename), info_dict)
+            return True
+
+    formats = [
+        dict(
+            format_id=format_id,
+            url=f"https://media.test/{format_id}",
+            protocol="https",
+            vcodec=vcodec,
+            acodec=acodec,
+            filepath=str(tmp_path.joinpath(f"media.f{format_id}")),
+        )
+        for format_id, vcodec, acodec in [
+            ("137", "avc1", "none"),
+            ("140", "none", "mp4a"),
+        ]
+    ]
+    info_dict = dict(
+        url="\n".join(format["url"] for format in formats),
+        protocol="https+https",
+        requested_formats=formats,
+    )
+    youtube_dl_module = importlib.import_module("yt_dlp.YoutubeDL")
+    assert youtube_dl_module.get_suitable_downloader(info_dict, {}) is (
+        merging.MergedStreamsFD
+    )
+    assert youtube_dl_module.get_suitable_downloader(formats[0], {}) is not (
+        merging.MergedStreamsFD
+    )
+
+    monkeypatch.setattr(merging, "get_stream_downloader", lambda info, params: StreamFD)
+    ydl = YoutubeDL(dict(quiet=True, noprogress=True))
+    downloader = merging.MergedStreamsFD(ydl, ydl.params)
+    events = []
+    downloader.add_progress_hook(lambda d: events.append((d["stream"], d["status"])))
+    assert downloader.download(str(tmp_path.joinpath("media.mp4")), info_dict) == (
+        True,
+        True,
+    )
+    assert tmp_path.joinpath("media.f137").read_text() == "137"
+    assert tmp_path.joinpath("media.f140").read_text() == "140"
+    assert sorted(events) == [
+        ("audio", "downloading"),
+        ("audio", "finished"),
+        ("video", "downloading"),
+        ("video", "finished"),
+    ]
+
+
+def test_download_stream_aborts_on_fetch_failure(monkeypatch):
+    import httpx
+    from app.config import download_dir
+    from app.v1 import routes, streaming
+
+    media = b"audio-bytes" * 1000
+    extracted_info = make_extracted_info("HUGcwe93F9E", "Broken stream test")
+
+    def respond(request: httpx.Request):
+        start, end = map(int, request.headers["Range"][6:].split("-"))
+        if start:
+            raise httpx.ReadError("Connection reset", request=request)
+        return httpx.Response(
+            206,
+            content=media[start : end + 1],
+            headers={"Content-Range": f"bytes {start}-{end}/{len(media)}"},
+        )
+
+    monkeypatch.setattr(
+        streaming,
+        "media_client",
+        httpx.AsyncClient(transport=httpx.MockTransport(respond)),
+    )
+    monkeypatch.setattr(streaming.loaded_config, "stream_chunk_size", 4096)
+    monkeypatch.setattr(
+        routes, "get_downloadable_extracted_info", lambda yt, url: extracted_info
+    )
+    monkeypatch.setattr(routes.loaded_config, "default_audio_format", "m4a")
+
+    with pytest.raises(httpx.ReadError):
+        client.get(
+            "/api/v1/download/stream",
+            params=dict(url="HUGcwe93F9E", quality="medium"),
+        )
+    assert not download_dir.joinpath("Broken stream test (medium).m4a").exists()
+    assert not list(download_dir.glob("Broken stream test (medium).m4a.*.part"))
+
+
+def test_process_download_executor(monkeypatch):
+    import os
+    import time
+    import multiprocessing
+    from uuid import uuid4
+    from app.config import download_dir
+    from app.v1 import downloads, routes
+
+    release = multiprocessing.get_context("fork").Event()
+
+    def download_media(extracted_info, payload, progress_hooks=[], **kwargs):
+        if payload.url.startswith("crash"):
+            os._exit(1)
+        release.wait(5)
+        filepath = download_dir.joinpath(f"{payload.url}.m4a")
+        filepath.write_text(str(os.getpid()))
+        for hook in progress_hooks:
+            hook(dict(status="downloading", downloaded_bytes=1, info_dict={}))
+            hook(dict(status="finished", downloaded_bytes=2, filename=filepath.name))
+        return filepath
+
+    def run_download_job(video_id: str, progress_hooks: list = []) -> dict:
+        resp = client.post("/api/v1/jobs", json=dict(url=video_id, quality="medium"))
+        assert resp.status_code == 202
+        job_id = resp.json()["id"]
+        routes.download_jobs.get(job_id).progress.attach(progress_hooks)
+        release.set()
+        for _ in range(100):
+            job = client.get(f"/api/v1/jobs/{job_id}").json()
+            if job["status"] in ("done", "failed"):
+                return job
+            time.sleep(0.05)
+
+    extracted_info = make_extracted_info("HUGcwe93F9E", "Process test")
+    monkeypatch.setattr(
+        routes, "get_downloadable_extracted_info", lambda yt, url: extracted_info
+    )
+    monkeypatch.setattr(downloads, "download_media", download_media)
+    process_downloader = downloads.ProcessDownloader(workers=1)
+    monkeypatch.setattr(downloads, "process_downloader", process_downloader)
+    # Forked after download_media is stubbed for the workers to inherit it
+    process_downloader.start()
+    try:
+        events = []
+        video_id = uuid4().hex[:11]
+        job = run_download_job(video_id, [events.append])
+        assert job["status"] == "done", job
+        filepath = download_dir.joinpath(job["result"]["filename"])
+        assert int(filepath.read_text()) != os.getpid()
+        assert events == [
+            dict(status="downloading", downloaded_bytes=1),
+            dict(status="finished", downloaded_bytes=2, filename=filepath.name),
+        ]
+        filepath.unlink()
+
+        assert run_download_job(f"crash{uuid4().hex[:6]}")["status"] == "failed"
+        assert not process_downloader.is_running
+        process_downloader.start()
+        assert not process_downloader.is_running
+
+        job = run_download_job(uuid4().hex[:11])
+        assert job["status"] == "done", job
+        filepath = download_dir.joinpath(job["result"]["filename"])
+        assert int(filepath.read_text()) == os.getpid()
+        filepath.unlink()
+    finally:
+        process_downloader.shutdown()